@@ -1,17 +1,61 @@
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-from PIL import Image, ImageTk
-import cv2
+from PIL import Image, ImageTk, ImageOps
 import os
+import queue
+import threading
+import traceback
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from do import ProcessingPipeline
 from core.evaluator import CalligraphyEvaluator
-from core.database import CalligraphyDB
-import requests
-import base64
-import json
+from core.database import SubmissionWriter
 import sqlite3
 from core.art import ArtEvaluator
+from core.feature_store import FeatureStore
+from core.recognizer import CharacterRecognizer
+from core.char_index import get_char_index
+from utils.lru_cache import LRUCache
+from utils.ocr_client import OCRClient, BaiduOCRBackend, default_token_file
+
+class TaskCancelled(Exception):
+    """后台任务已被取消"""
+    pass
+
+class TaskError(Exception):
+    """后台任务中需要以指定标题提示用户的错误"""
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+
+class BackgroundTask:
+    """
+    提交到后台线程的界面任务
+    工作函数通过 progress() 报告进度，两步之间调用 check() 响应取消
+    （正在执行的单个步骤无法中断，取消在下一步开始前生效）
+    """
+    def __init__(self, app, label, image_path):
+        self.app = app
+        self.label = label
+        self.image_path = image_path
+        self.future = None
+        self._cancelled = threading.Event()
+    
+    def cancel(self):
+        """请求取消；尚在排队的任务直接移出队列"""
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+    
+    def check(self):
+        """已请求取消时抛出 TaskCancelled"""
+        if self._cancelled.is_set():
+            raise TaskCancelled(self.label)
+    
+    def progress(self, message, fraction=None):
+        """在界面线程中更新状态栏与进度条（fraction 为 0~1）"""
+        self.check()
+        self.app.post(self.app.on_task_progress, self, message, fraction)
 
 class CalligraphyApp:
     def __init__(self, root):
@@ -20,11 +64,22 @@ class CalligraphyApp:
         self.root.geometry("1000x700")
         
         # 初始化组件
-        self.processor = ProcessingPipeline()
+        self.processors = {}   # (网格数, 墨迹区域优先) -> 处理器（按各字体标准库的构建参数提取特征）
+        self.style_processors = {}  # 字体样式 -> 处理器
         self.evaluator = None
         self.db = None
+        self.recognizers = {}  # 字体样式 -> 本地识别器
+        self.evaluators = {}   # 字体样式 -> 长期持有的评价器（含数据库连接）
+        self.writers = {}      # 字体样式 -> 用户作品写入器（后台线程写入，不阻塞界面与查询）
+        # 分析、识别与评价在单个后台线程中按提交顺序执行，界面不等待；可在评价期间加载并排队下一张作品
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="app-task")
+        self.tasks = []        # 排队及执行中的任务（按提交顺序）
+        # 后台线程不直接调用 Tk，结果放入队列，由界面线程定时取出处理
+        self.ui_events = queue.Queue()
+        self.feature_cache = LRUCache(maxsize=2048)  # (字体样式, 编码) -> 解码后的标准特征
         self.current_image_path = None
         self.current_features = None
+        self.features_style = None  # 当前特征按哪种字体标准库的设置提取
         self.char_code = None
         self.font_style = tk.StringVar(value="regular")  # 默认字体样式
         
@@ -38,37 +93,86 @@ class CalligraphyApp:
             "api_key": "",
             "secret_key": "",
             "token_url": "https://aip.baidubce.com/oauth/2.0/token",
-            "ocr_url": "https://aip.baidubce.com/rest/2.0/ocr/v1/general_basic"
+            "ocr_url": "https://aip.baidubce.com/rest/2.0/ocr/v1/general_basic",
+            "token_file": default_token_file()  # 保存在用户缓存目录，token 有效期内重启无需重新获取
         }
+        self.ocr_client = None
         
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(50, self.process_ui_events)
     
-    def generate_char_map(self):
-        """使用Unicode编码生成字符映射表"""
-        char_map = {}
-        
-        # 覆盖Unicode基本多文种平面（U+0000 到 U+FFFF）
-        for code_point in range(0x4E00, 0x9FFF + 1):  # 汉字区
-            char = chr(code_point)
-            char_code = hex(code_point)[2:].upper().zfill(4)
-            char_map[char_code] = char
-        
-        # 添加ASCII字符
-        for char in "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789":
-            char_code = hex(ord(char))[2:].upper().zfill(4)
-            char_map[char_code] = char
-        
-        # 添加标点符号
-        punctuations = "，。、；：？！「」『』【】（）《》〈〉“”‘’…—～·"
-        for char in punctuations:
-            char_code = hex(ord(char))[2:].upper().zfill(4)
-            char_map[char_code] = char
-        
-        return char_map
+    def post(self, callback, *args):
+        """从任意线程提交在界面线程中执行的回调"""
+        self.ui_events.put((callback, args))
     
-    def check_database(self, char_code):
-        """检查字符在数据库中的存在情况"""
-        font_style = self.font_style.get()
+    def process_ui_events(self):
+        """界面线程：执行后台线程提交的回调，并通过 root.after 定时继续"""
+        try:
+            while True:
+                try:
+                    callback, args = self.ui_events.get_nowait()
+                except queue.Empty:
+                    break
+                # 单个回调出错只报告，不影响后续回调和定时轮询
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"界面回调出错: {getattr(callback, '__name__', callback)}: {str(e)}")
+                    traceback.print_exc()
+                    self.status_var.set(f"错误: {str(e)}")
+        finally:
+            self.root.after(50, self.process_ui_events)
+    
+    def get_evaluator(self, font_style):
+        """获取指定字体的评价器，首次使用时创建并在程序运行期间复用"""
+        if font_style not in self.evaluators:
+            db_path = os.path.join(self.project_root, "data", f"calligraphy_{font_style}.db")
+            self.evaluators[font_style] = CalligraphyEvaluator(
+                db_path, font_style, feature_cache=self.feature_cache
+            )
+        return self.evaluators[font_style]
+    
+    def get_processor(self, font_style):
+        """
+        获取与指定字体标准库一致的处理器：网格数与墨迹区域优先设置取自特征存储（与 CalligraphyGrader 相同），
+        没有特征存储时为默认的 3 与 False
+        :raises ValueError: 标准库记录的其他预处理参数与本程序不一致
+        """
+        if font_style not in self.style_processors:
+            grid_size, roi, store = 3, False, None
+            db_path = os.path.join(self.project_root, "data", f"calligraphy_{font_style}.db")
+            if os.path.exists(db_path):
+                store = self.get_evaluator(font_style).feature_store
+                if store is not None:
+                    grid_size = int(round(store.grid_cells ** 0.5))
+                    roi = bool(store.preprocess.get("roi")) if store.preprocess else False
+            key = (grid_size, roi)
+            if key not in self.processors:
+                self.processors[key] = ProcessingPipeline(grid_size=grid_size, roi=roi)
+            mismatch = store.preprocess_mismatch(self.processors[key].config()) if store is not None else []
+            if mismatch:
+                raise ValueError(f"预处理参数与构建{font_style}标准库时不一致: {', '.join(mismatch)}，请重新构建数据库")
+            self.style_processors[font_style] = self.processors[key]
+        return self.style_processors[font_style]
+    
+    def get_writer(self, font_style):
+        """获取指定字体数据库的用户作品写入器"""
+        if font_style not in self.writers:
+            db_path = os.path.join(self.project_root, "data", f"calligraphy_{font_style}.db")
+            self.writers[font_style] = SubmissionWriter(db_path)
+        return self.writers[font_style]
+    
+    def get_char_index(self):
+        """共享的字符/编码索引，首次使用时加载"""
+        return get_char_index(
+            base_dir=os.path.join(self.project_root, "base"),
+            data_dir=os.path.join(self.project_root, "data")
+        )
+    
+    def check_database(self, char_code, font_style=None):
+        """检查字符在数据库中的存在情况（默认为当前选择的字体）"""
+        font_style = font_style or self.font_style.get()
         # 使用绝对路径构建数据库路径
         db_path = os.path.join(self.project_root, "data", f"calligraphy_{font_style}.db")
         
@@ -79,21 +183,10 @@ class CalligraphyApp:
             return False, f"数据库文件不存在: {db_path}"
         
         try:
-            # 连接到数据库
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # 查询字符是否存在 - 只使用char_code查询
-            cursor.execute("""
-            SELECT COUNT(*) 
-            FROM standard_chars 
-            WHERE char_code = ?
-            """, (char_code,))
-            
-            count = cursor.fetchone()[0]
-            conn.close()
-            
-            if count > 0:
+            # 字符索引中保存了各字体数据库的编码集合，无需逐次查询数据库；数据库重建后重新加载
+            char_index = self.get_char_index()
+            char_index.refresh_if_changed(font_style)
+            if char_index.has(font_style, char_code):
                 return True, f"字符 '{char_code}' 存在于数据库中"
             else:
                 return False, f"字符 '{char_code}' 不在数据库中"
@@ -119,6 +212,7 @@ class CalligraphyApp:
         tk.Button(top_frame, text="分析特征", command=self.analyze_features).pack(side=tk.LEFT, padx=5)
         tk.Button(top_frame, text="识别文字", command=self.recognize_text).pack(side=tk.LEFT, padx=5)
         tk.Button(top_frame, text="评价作品", command=self.evaluate).pack(side=tk.LEFT, padx=5)
+        tk.Button(top_frame, text="取消任务", command=self.cancel_tasks).pack(side=tk.LEFT, padx=5)
         
         # 图像显示
         image_frame = tk.LabelFrame(self.root, text="作品预览")
@@ -145,12 +239,92 @@ class CalligraphyApp:
         self.results_text = tk.Text(results_frame, height=10)
         self.results_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # 状态栏
+        # 状态栏与任务进度
+        status_frame = tk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
         self.status_var = tk.StringVar(value="就绪")
-        tk.Label(self.root, textvariable=self.status_var, bd=1, relief=tk.SUNKEN, anchor=tk.W).pack(side=tk.BOTTOM, fill=tk.X)
+        tk.Label(status_frame, textvariable=self.status_var, bd=1, relief=tk.SUNKEN, anchor=tk.W).pack(
+            side=tk.LEFT, fill=tk.X, expand=True)
+        self.progress = ttk.Progressbar(status_frame, length=200, mode="determinate", maximum=100)
+        self.progress.pack(side=tk.RIGHT, padx=5)
+    
+    def run_task(self, label, work, on_done, error_title="错误", error_prefix=None):
+        """
+        在后台线程中执行 work(task)，完成后在界面线程中调用 on_done(task, 结果)
+        任务按提交顺序依次执行，执行期间可以继续提交（排队）
+        :param error_title: 失败时错误对话框的标题（TaskError 自带标题）
+        :param error_prefix: 失败时错误信息的前缀
+        """
+        task = BackgroundTask(self, label, self.current_image_path)
+        self.tasks.append(task)
+        task.future = self.executor.submit(self._run_task, task, work)
+        task.future.add_done_callback(
+            lambda f: self.post(self.on_task_done, task, f, on_done, error_title, error_prefix)
+        )
+        if len(self.tasks) > 1:
+            self.status_var.set(f"已排队: {label}（前面还有 {len(self.tasks) - 1} 个任务）")
+        return task
+    
+    def _run_task(self, task, work):
+        """后台线程中执行任务"""
+        task.progress(f"正在{task.label}...", 0.0)
+        return work(task)
+    
+    def on_task_progress(self, task, message, fraction):
+        """界面线程：显示执行中任务的进度"""
+        if task not in self.tasks:
+            return
+        queued = len(self.tasks) - 1
+        self.status_var.set(message + (f"（排队: {queued}）" if queued else ""))
+        if fraction is not None:
+            self.progress["value"] = 100 * fraction
+    
+    def on_task_done(self, task, future, on_done, error_title, error_prefix):
+        """界面线程：任务结束后移出队列，显示结果或错误"""
+        if task in self.tasks:
+            self.tasks.remove(task)
+        if not self.tasks:
+            self.progress["value"] = 0
+        
+        if future.cancelled():
+            self.status_var.set(f"已取消: {task.label}")
+            return
+        error = future.exception()
+        if isinstance(error, TaskCancelled):
+            self.status_var.set(f"已取消: {task.label}")
+        elif isinstance(error, TaskError):
+            messagebox.showerror(error.title, str(error))
+            self.status_var.set(f"错误: {task.label}失败")
+        elif error is not None:
+            message = f"{error_prefix}: {str(error)}" if error_prefix else str(error)
+            messagebox.showerror(error_title, message)
+            self.status_var.set(f"错误: {str(error)}")
+        else:
+            on_done(task, future.result())
+    
+    def cancel_tasks(self):
+        """取消执行中与排队的全部任务"""
+        if not self.tasks:
+            self.status_var.set("没有正在执行的任务")
+            return
+        for task in list(self.tasks):
+            task.cancel()
+        self.status_var.set("正在取消任务...")
+    
+    def is_current(self, task):
+        """任务对应的作品是否仍是当前显示的作品（加载了下一张后，前一张的结果不再显示）"""
+        return task.image_path == self.current_image_path
+    
+    def make_thumbnail(self, file_path, size=(500, 500)):
+        """按预览尺寸解码（JPEG 直接以缩小的分辨率解码），并按EXIF方向旋转"""
+        img = Image.open(file_path)
+        img.draft("RGB", size)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(size)
+        return img
     
     def load_image(self):
-        """加载图像"""
+        """加载图像（执行中的任务不受影响，可继续为新作品排队）"""
         file_path = filedialog.askopenfilename(
             filetypes=[("图像文件", "*.jpg *.jpeg *.png *.bmp")]
         )
@@ -158,14 +332,18 @@ class CalligraphyApp:
             return
         
         try:
-            self.current_image_path = file_path
-            self.status_var.set(f"已加载: {os.path.basename(file_path)}")
-            
             # 显示图像
-            img = Image.open(file_path)
-            img.thumbnail((500, 500))
-            photo = ImageTk.PhotoImage(img)
+            photo = ImageTk.PhotoImage(self.make_thumbnail(file_path))
             
+            self.current_image_path = file_path
+            # 新图像需要重新分析特征和识别，清除上一张图像的结果
+            self.current_features = None
+            self.features_style = None
+            self.char_code = None
+            self.preprocessed_image = None
+            self.analysis = None
+            self.original_gray = None
+            self.status_var.set(f"已加载: {os.path.basename(file_path)}")
             self.image_label.config(image=photo)
             self.image_label.image = photo
         except Exception as e:
@@ -173,33 +351,40 @@ class CalligraphyApp:
             self.status_var.set(f"错误: {str(e)}")
     
     def analyze_features(self):
-        """分析特征"""
+        """分析特征（后台执行）"""
         if not self.current_image_path:
             messagebox.showwarning("警告", "请先加载图像")
             return
         
-        try:
-            self.status_var.set("正在分析特征...")
-            self.root.update()
+        font_style = self.font_style.get()
+        
+        def work(task):
             # 打印文件信息用于调试
-            file_ext = os.path.splitext(self.current_image_path)[1].lower()
-            print(f"分析图像: {self.current_image_path}, 格式: {file_ext}")
-            # 处理图像
-            result = self.processor.process_image(self.current_image_path)
-            self.current_features = result["features"]
-            
-            # 保存预处理后的图像用于艺术评价
-            self.preprocessed_image = result.get("preprocessed", None)
-            
-            # 保存原始灰度图像用于墨色分析
-            self.original_gray = cv2.imread(self.current_image_path, cv2.IMREAD_GRAYSCALE)
-            
-            # 显示特征
-            self.display_features()
-            self.status_var.set("特征分析完成")
-        except Exception as e:
-            messagebox.showerror("错误", f"特征分析失败: {str(e)}")
-            self.status_var.set(f"错误: {str(e)}")
+            file_ext = os.path.splitext(task.image_path)[1].lower()
+            print(f"分析图像: {task.image_path}, 格式: {file_ext}")
+            # 处理图像（网格数与预处理设置与当前字体的标准库一致）
+            return font_style, self.get_processor(font_style).process_image(task.image_path)
+        
+        self.run_task("分析特征", work, self.on_analyzed, error_prefix="特征分析失败")
+    
+    def on_analyzed(self, task, analyzed):
+        """界面线程：保存并显示特征分析结果"""
+        if not self.is_current(task):
+            self.status_var.set(f"{os.path.basename(task.image_path)} 的特征分析已完成（已切换作品，结果未使用）")
+            return
+        self.features_style, result = analyzed
+        self.current_features = result["features"]
+        
+        # 保存预处理后的图像及其分析上下文用于艺术评价
+        self.preprocessed_image = result.get("preprocessed", None)
+        self.analysis = result.get("analysis", None)
+        
+        # 保存原始灰度图像用于墨色分析（与特征提取共用同一次读取与解码）
+        self.original_gray = result.get("original", None)
+        
+        # 显示特征
+        self.display_features()
+        self.status_var.set("特征分析完成")
     
     def display_features(self):
         """显示特征信息"""
@@ -221,213 +406,236 @@ class CalligraphyApp:
         self.features_text.insert(tk.END, text)
     
     def recognize_text(self):
-        """使用百度OCR识别文字，并通过动态映射表获取编码"""
+        """识别文字（配置了百度OCR时优先使用，否则或失败时使用本地特征库识别），并获取编码（后台执行）"""
         if not self.current_image_path:
             messagebox.showwarning("警告", "请先加载图像")
             return
         
-        try:
-            self.status_var.set("正在识别文字...")
-            self.root.update()
-            
-            # 1. 获取百度OCR access token
-            token = self.get_baidu_token()
-            if not token:
-                raise Exception("获取百度OCR token失败")
-            
-            # 2. 读取图像并编码为base64
-            with open(self.current_image_path, "rb") as f:
-                base64_data = base64.b64encode(f.read()).decode()
-            
-            # 3. 准备OCR请求参数
-            headers = {'content-type': 'application/x-www-form-urlencoded'}
-            params = {
-                "access_token": token,
-                "image": base64_data,
-                "language_type": "CHN_ENG",  # 中英文混合
-                "detect_direction": "true",   # 检测文字方向
-                "recognize_granularity": "small"  # 精细识别模式
-            }
-            
-            # 4. 发送OCR请求
-            response = requests.post(self.ocr_config["ocr_url"], data=params, headers=headers)
-            response.raise_for_status()  # 检查HTTP错误
-            
-            # 5. 解析OCR结果
-            result = response.json()
-            if "error_code" in result:
-                error_msg = result.get("error_msg", "未知错误")
-                raise Exception(f"OCR识别错误: {error_msg} (错误码: {result['error_code']})")
-            
-            if "words_result" not in result or not result["words_result"]:
-                raise Exception("未识别到文字")
-            
-            # 6. 获取识别的第一个字符
-            recognized_text = result["words_result"][0]["words"]
-            if not recognized_text:
-                raise Exception("识别结果为空")
-            
-            first_char = recognized_text[0]  # 取第一个字符
-            self.status_var.set(f"识别结果: {first_char}")
-            
-            # 7. 动态生成字符映射表
-            char_map = self.generate_char_map()
-            
-            # 8. 查找字符对应的编码 - 确保4位十六进制格式
-            char_code = None
-            
-            # 方法1: 通过字符查找编码
-            for code, char in char_map.items():
-                if char == first_char:
-                    char_code = code
-                    break
-            
-            # 方法2: 如果找不到，使用Unicode编码
-            if not char_code:
+        # 提交时的特征与字体，执行期间界面上的修改不影响本次识别
+        features = self.current_features
+        features_style = self.features_style
+        font_style = self.font_style.get()
+        
+        def work(task):
+            first_char = None
+            # 特征按构建参数不同的其他字体标准库提取时，按当前字体重新提取
+            local_features = features
+            if features and self.get_processor(features_style) is not self.get_processor(font_style):
+                local_features = None
+            candidates = []
+            if self.ocr_config["api_key"] and self.ocr_config["secret_key"]:
+                task.progress("正在识别文字: 百度OCR...", 0.2)
                 try:
-                    char_code = hex(ord(first_char))[2:].upper().zfill(4)
-                    # 验证编码格式 (4位十六进制)
-                    if len(char_code) != 4 or not all(c in "0123456789ABCDEF" for c in char_code):
-                        raise ValueError("无效的Unicode编码")
-                    
-                    # 添加到映射表
-                    char_map[char_code] = first_char
+                    first_char = self.recognize_with_baidu(task.image_path)
                 except Exception as e:
-                    # 方法3: 使用字符本身作为编码
-                    char_code = first_char
-                    messagebox.showinfo("提示", f"使用字符本身作为编码: {char_code}")
-            
-            # 9. 保存识别结果
-            self.char_code = char_code
-            self.results_text.delete(1.0, tk.END)
-            self.results_text.insert(tk.END, f"识别到的字符: {first_char}\n编码: {char_code}")
-            self.status_var.set(f"识别完成: {first_char} (编码: {char_code})")
-        
-        except Exception as e:
-            messagebox.showerror("识别错误", f"文字识别失败: {str(e)}")
-            self.status_var.set(f"错误: {str(e)}")
+                    print(f"百度OCR识别失败，改用本地识别: {str(e)}")
+            
+            # 本地识别：与标准特征库比较，取最相似的字符
+            if not first_char:
+                task.progress("正在识别文字: 本地识别...", 0.5)
+                candidates = self.recognize_locally(image_path=task.image_path, features=local_features,
+                                                    font_style=font_style)
+                if not candidates:
+                    raise Exception("本地识别未找到候选字符")
+                first_char = candidates[0]["character"]
+            
+            # 7. 查找字符对应的编码（字符映射中没有时按Unicode换算）
+            return first_char, self.get_char_index().code(first_char), candidates
+        
+        self.run_task("识别文字", work, self.on_recognized,
+                      error_title="识别错误", error_prefix="文字识别失败")
     
-    def get_baidu_token(self):
-        """获取百度OCR access token"""
-        params = {
-            "grant_type": "client_credentials",
-            "client_id": self.ocr_config["api_key"],
-            "client_secret": self.ocr_config["secret_key"]
-        }
+    def on_recognized(self, task, result):
+        """界面线程：保存并显示识别结果"""
+        first_char, char_code, candidates = result
+        if not self.is_current(task):
+            self.status_var.set(f"{os.path.basename(task.image_path)} 识别为: {first_char}（已切换作品，结果未使用）")
+            return
         
-        try:
-            response = requests.get(self.ocr_config["token_url"], params=params)
-            response.raise_for_status()
-            token = response.json().get("access_token")
-            return token
-        except Exception as e:
-            messagebox.showerror("OCR错误", f"获取token失败: {str(e)}")
-            return None
+        # 8. 保存识别结果
+        self.char_code = char_code
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, f"识别到的字符: {first_char}\n编码: {char_code}")
+        if candidates:
+            text = "，".join(f"{c['character']}({c['distance']:.3f})" for c in candidates)
+            self.results_text.insert(tk.END, f"\n本地识别候选: {text}")
+        self.status_var.set(f"识别完成: {first_char} (编码: {char_code})")
+    
+    def recognize_with_baidu(self, image_path=None):
+        """使用百度OCR识别图像中的第一个字符（token 与识别结果由客户端缓存）"""
+        return self.get_ocr_client().first_char(image_path or self.current_image_path)
+    
+    def get_ocr_client(self):
+        """首次使用时创建OCR客户端，之后复用其会话、token 与结果缓存"""
+        if self.ocr_client is None:
+            backend = BaiduOCRBackend(
+                self.ocr_config["api_key"],
+                self.ocr_config["secret_key"],
+                token_url=self.ocr_config["token_url"],
+                ocr_url=self.ocr_config["ocr_url"],
+                token_file=self.ocr_config["token_file"]
+            )
+            self.ocr_client = OCRClient(backend)
+        return self.ocr_client
+    
+    def get_recognizer(self, font_style):
+        """获取（并缓存）指定字体的本地识别器"""
+        if font_style not in self.recognizers:
+            db_path = os.path.join(self.project_root, "data", f"calligraphy_{font_style}.db")
+            if not FeatureStore.exists(db_path):
+                raise Exception(
+                    f"未找到{font_style}字体的特征存储，"
+                    f"请运行 modelapp.py --style {font_style} --export-only"
+                )
+            self.recognizers[font_style] = CharacterRecognizer.from_db_path(db_path)
+        return self.recognizers[font_style]
+    
+    def recognize_locally(self, top_k=5, image_path=None, features=None, font_style=None):
+        """使用标准特征库在本地识别字符，返回按相似度排列的候选（参数默认为当前作品与字体）"""
+        if image_path is None:
+            image_path, features = self.current_image_path, self.current_features
+        font_style = font_style or self.font_style.get()
+        if not features:
+            features = self.get_processor(font_style).process_image(image_path)["features"]
+        return self.get_recognizer(font_style).recognize(features, top_k)
     
     def evaluate(self):
-        """评价作品"""
+        """评价作品（后台执行，结果显示后由写入线程保存）"""
         if not self.current_features or not self.char_code:
             messagebox.showwarning("警告", "请先分析特征并识别文字")
             return
         
-        try:
-            self.status_var.set("正在评价作品...")
-            self.root.update()
-            
-            # 动态加载当前字体的数据库
-            font_style = self.font_style.get()
-            # 使用绝对路径构建数据库路径
-            db_path = os.path.join(self.project_root, "data", f"calligraphy_{font_style}.db")
-            
-            # 打印路径用于调试
-            print(f"评价使用数据库路径: {db_path}")
-            
-            # 检查数据库是否存在
-            if not os.path.exists(db_path):
-                # 添加详细的错误提示和解决方案
-                error_msg = (
-                    f"未找到{font_style}字体的数据库！\n\n"
-                    f"路径: {db_path}\n\n"
-                    "请按以下步骤操作：\n"
-                    "1. 运行 builddata.py 生成标准字体图片\n"
-                    "2. 运行 modelapp.py --style {font_style} 构建数据库\n\n"
-                    "完成后重启本程序。"
-                )
-                messagebox.showerror("数据库错误", error_msg)
-                return
-            
-            # 检查字符是否在数据库中
-            exists, message = self.check_database(self.char_code)
-            if not exists:
-                # 添加调试信息
-                char_map = self.generate_char_map()
-                char = char_map.get(self.char_code, "未知字符")
-                
-                # 提供详细解决方案
-                solution = (
-                    f"{message}\n\n"
-                    f"字符: {char} (编码: {self.char_code})\n"
-                    f"字体样式: {font_style}\n"
-                    f"数据库路径: {db_path}\n\n"
-                    "可能原因及解决方案：\n"
-                    "1. 该字符不在标准字符集中\n"
-                    "2. 数据库构建不完整\n"
-                    "3. 字体文件不包含该字符\n\n"
-                    "请尝试：\n"
-                    "a) 检查数据库构建日志\n"
-                    "b) 重新构建数据库\n"
-                    "c) 使用不同字体"
-                )
-                messagebox.showerror("评价错误", solution)
-                return
-            
-            # 创建评价器
-            self.evaluator = CalligraphyEvaluator(db_path, font_style)
-            
-            # 评价作品
-            evaluation = self.evaluator.evaluate(self.current_features, self.char_code)
-            if not evaluation:
-                raise Exception("评价失败，未找到标准特征")
-            
-            # 添加艺术评价（只在笔画和结构得分合格时）
-            art_evaluation = {
-                "art_score": 0.0, 
-                "feedback": "笔画或结构得分过低，不进行艺术评价"
-            }
-            
-            # 只有当笔画和结构得分都超过0.5时才进行艺术评价
-            if evaluation["stroke_score"] > 0.5 and evaluation["structure_score"] > 0.5:
-                # 获取预处理后的图像（在特征分析时已保存）
-                if hasattr(self, 'preprocessed_image') and self.preprocessed_image is not None:
-                    art_evaluator = ArtEvaluator()
-                    art_evaluation = art_evaluator.evaluate_artistic_features(
-                        self.preprocessed_image, 
-                        self.original_gray  # 传递原始灰度图像用于墨色分析
-                    )
-                
-                # 将艺术得分纳入总分（权重30%）
-                evaluation["total_score"] = (
-                    0.7 * evaluation["total_score"] + 
-                    0.3 * art_evaluation["art_score"]
+        # 提交时的作品状态，排队期间加载下一张作品不影响本次评价与保存
+        job = {
+            "image_path": self.current_image_path,
+            "font_style": self.font_style.get(),
+            "char_code": self.char_code,
+            "features": self.current_features,
+            "features_style": self.features_style,
+            "preprocessed": getattr(self, 'preprocessed_image', None),
+            "original": getattr(self, 'original_gray', None),
+            "analysis": getattr(self, 'analysis', None)
+        }
+        self.run_task(
+            "评价作品",
+            lambda task: self.evaluate_job(task, job),
+            lambda task, evaluation: self.on_evaluated(task, job, evaluation),
+            error_title="评价错误", error_prefix="评价失败"
+        )
+    
+    def evaluate_job(self, task, job):
+        """后台线程：评价提交时的作品，返回评价结果"""
+        font_style = job["font_style"]
+        char_code = job["char_code"]
+        task.progress("正在评价作品: 检查数据库...", 0.1)
+        
+        # 使用绝对路径构建数据库路径
+        db_path = os.path.join(self.project_root, "data", f"calligraphy_{font_style}.db")
+        
+        # 打印路径用于调试
+        print(f"评价使用数据库路径: {db_path}")
+        
+        # 检查数据库是否存在
+        if not os.path.exists(db_path):
+            # 添加详细的错误提示和解决方案
+            error_msg = (
+                f"未找到{font_style}字体的数据库！\n\n"
+                f"路径: {db_path}\n\n"
+                "请按以下步骤操作：\n"
+                "1. 运行 builddata.py 生成标准字体图片\n"
+                "2. 运行 modelapp.py --style {font_style} 构建数据库\n\n"
+                "完成后重启本程序。"
+            )
+            raise TaskError("数据库错误", error_msg)
+        
+        # 检查字符是否在数据库中
+        exists, message = self.check_database(char_code, font_style)
+        if not exists:
+            # 添加调试信息
+            char = self.get_char_index().char(char_code) or "未知字符"
+            
+            # 提供详细解决方案
+            solution = (
+                f"{message}\n\n"
+                f"字符: {char} (编码: {char_code})\n"
+                f"字体样式: {font_style}\n"
+                f"数据库路径: {db_path}\n\n"
+                "可能原因及解决方案：\n"
+                "1. 该字符不在标准字符集中\n"
+                "2. 数据库构建不完整\n"
+                "3. 字体文件不包含该字符\n\n"
+                "请尝试：\n"
+                "a) 检查数据库构建日志\n"
+                "b) 重新构建数据库\n"
+                "c) 使用不同字体"
+            )
+            raise TaskError("评价错误", solution)
+        
+        # 特征按构建参数不同的其他字体标准库提取时（分析后切换了字体），按当前字体重新提取
+        processor = self.get_processor(font_style)
+        if processor is not self.get_processor(job["features_style"]):
+            task.progress("正在评价作品: 按当前字体重新提取特征...", 0.2)
+            result = processor.process_image(job["image_path"])
+            job.update(features=result["features"], features_style=font_style,
+                       preprocessed=result["preprocessed"], original=result["original"],
+                       analysis=result["analysis"])
+        
+        # 复用当前字体的评价器
+        task.progress("正在评价作品: 对比标准特征...", 0.3)
+        self.evaluator = self.get_evaluator(font_style)
+        
+        # 评价作品
+        evaluation = self.evaluator.evaluate(job["features"], char_code)
+        if not evaluation:
+            raise Exception("评价失败，未找到标准特征")
+        
+        # 添加艺术评价（只在笔画和结构得分合格时）
+        art_evaluation = {
+            "art_score": 0.0, 
+            "feedback": "笔画或结构得分过低，不进行艺术评价"
+        }
+        
+        # 只有当笔画和结构得分都超过0.5时才进行艺术评价
+        if evaluation["stroke_score"] > 0.5 and evaluation["structure_score"] > 0.5:
+            # 获取预处理后的图像（在特征分析时已保存）
+            if job["preprocessed"] is not None:
+                task.progress("正在评价作品: 艺术评价...", 0.6)
+                art_evaluator = ArtEvaluator()
+                art_evaluation = art_evaluator.evaluate_artistic_features(
+                    job["preprocessed"], 
+                    job["original"],  # 传递原始灰度图像用于墨色分析
+                    analysis=job["analysis"]
                 )
             
-            # 添加艺术评价结果
-            evaluation["art"] = art_evaluation
-            
+            # 将艺术得分纳入总分（权重30%）
+            evaluation["total_score"] = (
+                0.7 * evaluation["total_score"] + 
+                0.3 * art_evaluation["art_score"]
+            )
+        
+        # 添加艺术评价结果
+        evaluation["art"] = art_evaluation
+        task.progress("正在评价作品: 完成", 1.0)
+        return evaluation
+    
+    def on_evaluated(self, task, job, evaluation):
+        """界面线程：显示评价结果（已切换作品时只在状态栏提示），并保存到数据库"""
+        if self.is_current(task):
             # 显示结果
-            self.display_evaluation(evaluation)
+            self.display_evaluation(evaluation, job["font_style"])
             self.status_var.set("评价完成")
-            
-            # 保存结果到数据库
-            self.save_to_database(evaluation)
-        except Exception as e:
-            messagebox.showerror("评价错误", f"评价失败: {str(e)}")
-            self.status_var.set(f"错误: {str(e)}")
+        else:
+            self.status_var.set(
+                f"{os.path.basename(task.image_path)} 评价完成: 综合得分 {evaluation['total_score']:.2f}"
+            )
+        
+        # 保存结果到数据库
+        self.save_to_database(evaluation, job)
     
-    def display_evaluation(self, evaluation):
+    def display_evaluation(self, evaluation, font_style=None):
         """显示评价结果"""
         text = f"=== 书法评价结果 ===\n"
-        text += f"字体标准: {self.font_style.get()}\n"
+        text += f"字体标准: {font_style or self.font_style.get()}\n"
         text += f"综合得分: {evaluation['total_score']:.2f}/1.00\n"
         text += f"笔画得分: {evaluation['stroke_score']:.2f}/1.00\n"
         text += f"结构得分: {evaluation['structure_score']:.2f}/1.00\n"
@@ -456,39 +664,70 @@ class CalligraphyApp:
         self.results_text.delete(1.0, tk.END)
         self.results_text.insert(tk.END, text)
     
-    def save_to_database(self, evaluation):
-        """保存结果到数据库"""
-        if not self.current_image_path or not self.char_code:
+    def save_to_database(self, evaluation, job=None):
+        """保存结果到数据库（job 为评价提交时的作品状态，默认为当前作品）"""
+        if job is None:
+            job = {
+                "image_path": self.current_image_path,
+                "font_style": self.font_style.get(),
+                "char_code": self.char_code,
+                "features": self.current_features
+            }
+        if not job["image_path"] or not job["char_code"]:
             return
         
-        try:
-            # 创建临时数据库连接
-            font_style = self.font_style.get()
-            db_path = os.path.join(self.project_root, "data", f"calligraphy_{font_style}.db")
-            temp_db = CalligraphyDB(db_path)
-            
-            # 插入用户提交记录
-            temp_db.conn.execute("""
-            INSERT INTO user_submissions (file_path, char_code, score, features)
-            VALUES (?, ?, ?, ?)
-            """, (
-                self.current_image_path,
-                self.char_code,
-                evaluation["total_score"],
-                json.dumps(self.current_features)
-            ))
-            temp_db.conn.commit()
-            temp_db.close()
+        # 插入用户提交记录（由写入线程完成，界面不等待）
+        future = self.get_writer(job["font_style"]).submit(
+            job["image_path"],
+            job["char_code"],
+            evaluation["total_score"],
+            job["features"]
+        )
+        future.add_done_callback(
+            lambda f: self.post(self.on_saved, f.exception())
+        )
+    
+    def on_saved(self, error):
+        """写入完成后在界面线程中更新状态"""
+        if error is None:
             self.status_var.set("结果已保存到数据库")
-        except sqlite3.Error as e:
-            messagebox.showerror("数据库错误", f"保存结果失败: {str(e)}")
+        elif isinstance(error, sqlite3.Error):
+            messagebox.showerror("数据库错误", f"保存结果失败: {str(error)}")
+        else:
+            messagebox.showerror("保存错误", f"保存结果失败: {str(error)}")
+    
+    def close_resources(self):
+        """取消排队的任务并等待执行中的任务结束，关闭所有评价器的数据库连接，并写完排队的用户作品"""
+        for task in getattr(self, 'tasks', []):
+            task.cancel()
+        if getattr(self, 'executor', None) is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        for writer in getattr(self, 'writers', {}).values():
+            writer.close()
+        self.writers = {}
+        for evaluator in getattr(self, 'evaluators', {}).values():
+            evaluator.close()
+        self.evaluators = {}
+        self.evaluator = None
+        if getattr(self, 'ocr_client', None) is not None:
+            self.ocr_client.close()
+            self.ocr_client = None
+        for processor in getattr(self, 'processors', {}).values():
+            processor.close()
+        self.processors = {}
+        self.style_processors = {}
+    
+    def on_close(self):
+        """关闭窗口时释放资源"""
+        self.close_resources()
+        self.root.destroy()
     
     def __del__(self):
         """清理资源"""
         if hasattr(self, 'db') and self.db:
             self.db.close()
-        if hasattr(self, 'evaluator') and self.evaluator:
-            self.evaluator.close()
+        self.close_resources()
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -3,16 +3,49 @@ import json
 from PIL import Image, ImageFont, ImageDraw
 import argparse
 import traceback
+from multiprocessing import Pool
+
+# 每个进程内已加载的字体: (字体路径, 尺寸) -> ImageFont，保证每个工作进程只加载一次
+_loaded_fonts = {}
+
+def _render_shard(task):
+    """渲染并保存一组字符图片，返回成功的 (字符, 编码, 文件名) 列表（可在工作进程中运行）"""
+    font_path, style_dir, chars, size = task
+    font = _loaded_fonts.get((font_path, size))
+    if font is None:
+        font = FontImageGenerator.load_font(font_path, size)
+        _loaded_fonts[(font_path, size)] = font
+    
+    rendered = []
+    for char in chars:
+        try:
+            # 获取字符编码 - 确保4位大写十六进制格式
+            char_code = hex(ord(char))[2:].upper().zfill(4)
+            
+            # 绘制字符图片
+            img = FontImageGenerator.render_char(font, char, size)
+            
+            # 保存图片
+            filename = f"{char_code}.png"
+            img.save(os.path.join(style_dir, filename))
+            rendered.append((char, char_code, filename))
+        except Exception as e:
+            print(f"生成字符 '{char}' 图片失败: {str(e)}")
+            traceback.print_exc()
+    
+    return rendered
 
 class FontImageGenerator:
+    # 各字体样式对应的字体文件
+    font_files = {
+        "light": "LXGWWenKaiMono-Light.ttf",
+        "medium": "LXGWWenKaiMono-Medium.ttf",
+        "regular": "LXGWWenKaiMono-Regular.ttf"
+    }
+    
     def __init__(self, font_dir="fonts", output_dir="base"):
         self.font_dir = font_dir
         self.output_dir = output_dir
-        self.font_files = {
-            "light": "LXGWWenKaiMono-Light.ttf",
-            "medium": "LXGWWenKaiMono-Medium.ttf",
-            "regular": "LXGWWenKaiMono-Regular.ttf"
-        }
         self.common_chars = self.load_common_chars()
         self.char_map = {}
         
@@ -21,7 +54,8 @@ class FontImageGenerator:
         for style in self.font_files.keys():
             os.makedirs(os.path.join(output_dir, style), exist_ok=True)
     
-    def load_common_chars(self):
+    @staticmethod
+    def load_common_chars():
         """加载常用汉字集（GB2312字符集，共6763个汉字）"""
         chars = []
         # GB2312 字符集范围: 0xB0A1-0xF7FE
@@ -36,23 +70,32 @@ class FontImageGenerator:
                 continue
         return chars
     
-    def generate_font_images(self):
-        """生成所有字体样式的字符图片"""
+    def generate_font_images(self, workers=1):
+        """
+        生成所有字体样式的字符图片
+        :param workers: 工作进程数，大于1时将所有字体的字符分片并行渲染
+        """
         # 创建一个包含所有信息的字典
         total_map = {
             "global_map": {},  # 全局字符映射（编码->字符）
             "style_maps": {}   # 按字体分类的映射
         }
         
-        for style, font_file in self.font_files.items():
-            font_path = os.path.join(self.font_dir, font_file)
-            if not os.path.exists(font_path):
-                print(f"警告: 找不到字体文件 {font_path}, 跳过")
-                continue
-            
-            print(f"正在生成 '{style}' 字体图片...")
-            # 生成当前字体的字符映射
-            style_map = self.generate_style_images(font_path, style)
+        if workers > 1:
+            style_maps = self.generate_images_parallel(workers)
+        else:
+            style_maps = {}
+            for style, font_file in self.font_files.items():
+                font_path = os.path.join(self.font_dir, font_file)
+                if not os.path.exists(font_path):
+                    print(f"警告: 找不到字体文件 {font_path}, 跳过")
+                    continue
+                
+                print(f"正在生成 '{style}' 字体图片...")
+                # 生成当前字体的字符映射
+                style_maps[style] = self.generate_style_images(font_path, style)
+        
+        for style, style_map in style_maps.items():
             if style_map:  # 检查是否成功生成了映射
                 total_map["style_maps"][style] = style_map
         
@@ -63,55 +106,103 @@ class FontImageGenerator:
         self.save_char_map(total_map)
         print(f"所有字体图片已生成到: {self.output_dir}")
     
+    def generate_images_parallel(self, workers, size=128, shards_per_worker=4):
+        """
+        多进程生成所有字体样式的字符图片
+        字符列表按顺序分片，结果按原顺序合并，映射与文件名与单进程生成完全一致
+        :return: 字体样式 -> 字符映射
+        """
+        shard_count = workers * shards_per_worker
+        shard_size = max(1, (len(self.common_chars) + shard_count - 1) // shard_count)
+        shards = [self.common_chars[i:i + shard_size]
+                  for i in range(0, len(self.common_chars), shard_size)]
+        
+        tasks = []
+        styles = []
+        for style, font_file in self.font_files.items():
+            font_path = os.path.join(self.font_dir, font_file)
+            if not os.path.exists(font_path):
+                print(f"警告: 找不到字体文件 {font_path}, 跳过")
+                continue
+            
+            print(f"正在生成 '{style}' 字体图片...")
+            if not self.check_font(font_path, size):
+                continue
+            styles.append(style)
+            style_dir = os.path.join(self.output_dir, style)
+            tasks.extend((font_path, style_dir, shard, size) for shard in shards)
+        
+        print(f"使用 {workers} 个工作进程并行渲染 {len(tasks)} 个分片")
+        with Pool(processes=workers) as pool:
+            results = pool.map(_render_shard, tasks, chunksize=1)
+        
+        # 按字体和分片的原始顺序记录映射
+        style_maps = {}
+        for index, style in enumerate(styles):
+            rendered = []
+            for shard_result in results[index * len(shards):(index + 1) * len(shards)]:
+                rendered.extend(shard_result)
+            style_maps[style] = self.record_style_images(rendered)
+        return style_maps
+    
     def generate_style_images(self, font_path, style, size=128):
         """生成特定字体的字符图片"""
-        char_list = {}
+        if not self.check_font(font_path, size):
+            return {}
+        
+        style_dir = os.path.join(self.output_dir, style)
+        rendered = _render_shard((font_path, style_dir, self.common_chars, size))
+        return self.record_style_images(rendered)
+    
+    def check_font(self, font_path, size=128):
+        """检查字体文件是否存在且可以加载"""
         try:
             # 检查字体文件是否存在
             if not os.path.exists(font_path):
                 print(f"错误: 找不到字体文件 {font_path}")
                 print("请将字体文件放在 'fonts' 目录下")
-                return char_list
+                return False
             
             # 加载字体
-            font = ImageFont.truetype(font_path, int(size * 0.7))
+            self.load_font(font_path, size)
             print(f"成功加载字体: {font_path}")
+            return True
         except Exception as e:
             print(f"字体加载失败: {str(e)}")
             traceback.print_exc()
-            return char_list
+            return False
+    
+    def record_style_images(self, rendered):
+        """根据渲染结果记录字体映射和全局映射"""
+        char_list = {}
+        for char, char_code, filename in rendered:
+            # 记录字符映射
+            char_list[char] = filename
+            if char_code not in self.char_map:
+                self.char_map[char_code] = char
+        return char_list
+    
+    @staticmethod
+    def load_font(font_path, size=128):
+        """按图片尺寸加载字体"""
+        return ImageFont.truetype(font_path, int(size * 0.7))
+    
+    @staticmethod
+    def render_char(font, char, size=128):
+        """在内存中绘制单个字符，返回白底黑字的灰度图"""
+        # 创建图片
+        img = Image.new("L", (size, size), 255)
+        draw = ImageDraw.Draw(img)
         
-        for char in self.common_chars:
-            try:
-                # 获取字符编码 - 确保4位大写十六进制格式
-                char_code = hex(ord(char))[2:].upper().zfill(4)
-                
-                # 创建图片
-                img = Image.new("L", (size, size), 255)
-                draw = ImageDraw.Draw(img)
-                
-                # 绘制字符（调整位置使其居中）
-                bbox = draw.textbbox((0, 0), char, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                x = (size - text_width) / 2 - bbox[0]
-                y = (size - text_height) / 2 - bbox[1]
-                
-                draw.text((x, y), char, fill=0, font=font)
-                
-                # 保存图片
-                filename = f"{char_code}.png"
-                img.save(os.path.join(self.output_dir, style, filename))
-                
-                # 记录字符映射
-                char_list[char] = filename
-                if char_code not in self.char_map:
-                    self.char_map[char_code] = char
-            except Exception as e:
-                print(f"生成字符 '{char}' 图片失败: {str(e)}")
-                traceback.print_exc()
+        # 绘制字符（调整位置使其居中）
+        bbox = draw.textbbox((0, 0), char, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        x = (size - text_width) / 2 - bbox[0]
+        y = (size - text_height) / 2 - bbox[1]
         
-        return char_list
+        draw.text((x, y), char, fill=0, font=font)
+        return img
     
     def save_char_map(self, total_map):
         """保存编码与汉字的映射关系"""
@@ -129,6 +220,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='生成标准字体图片')
     parser.add_argument('--font-dir', default="fonts", help='字体文件目录')
     parser.add_argument('--output-dir', default="base", help='输出目录')
+    parser.add_argument('--workers', type=int, default=1, help='并行渲染的工作进程数 (默认: 1)')
     args = parser.parse_args()
     
     print("=" * 50)
@@ -140,7 +232,7 @@ if __name__ == "__main__":
         font_dir=args.font_dir,
         output_dir=args.output_dir
     )
-    generator.generate_font_images()
+    generator.generate_font_images(workers=args.workers)
     
     print("=" * 50)
     print("生成完成!")
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+from .thinning import thinning
+
+class ImageAnalysis:
+    """
+    单幅预处理图像的分析上下文
+    二值图、距离变换、骨架和轮廓按需计算并缓存，特征提取与艺术评价共用
+    """
+    def __init__(self, image):
+        if image.dtype != np.uint8:
+            image = image.astype(np.uint8)
+        self.image = image
+        self._cache = {}
+    
+    def _cached(self, key, compute):
+        """取缓存结果，不存在时计算"""
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+    
+    @property
+    def binary(self):
+        """二值图像（笔画为255）"""
+        return self._cached("binary", lambda: cv2.threshold(self.image, 127, 255, cv2.THRESH_BINARY)[1])
+    
+    def distance_transform(self):
+        """距离变换"""
+        return self._cached("dist", lambda: cv2.distanceTransform(self.binary, cv2.DIST_L2, 3))
+    
+    def distance_values(self):
+        """距离变换中大于0的值（笔画宽度分布）"""
+        def compute():
+            dist_transform = self.distance_transform()
+            return dist_transform[dist_transform > 0]
+        return self._cached("dist_values", compute)
+    
+    def skeleton(self):
+        """骨架"""
+        return self._cached("skeleton", lambda: thinning(self.binary))
+    
+    def contours(self):
+        """外轮廓"""
+        return self._cached("contours", lambda: cv2.findContours(
+            self.binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[0])
\ No newline at end of file
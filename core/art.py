@@ -1,33 +1,38 @@
 import cv2
 import numpy as np
 from scipy import ndimage
+from .geometry import contour_curvature
+from .thinning import thinning
+from .analysis import ImageAnalysis
 
 class ArtEvaluator:
     def __init__(self):
         pass
     
-    def evaluate_artistic_features(self, image, original_gray=None):
+    def evaluate_artistic_features(self, image, original_gray=None, analysis=None):
         """
         评估艺术特征：顿笔、笔锋、墨色梯度等
         :param image: 预处理后的二值图像
         :param original_gray: 原始灰度图像（用于墨色梯度分析）
+        :param analysis: 特征提取阶段产生的 ImageAnalysis，可复用其中间结果
         """
-        # 预处理确保图像是二值化的
-        if image.dtype != np.uint8:
-            image = image.astype(np.uint8)
-        _, binary = cv2.threshold(image, 127, 255, cv2.THRESH_BINARY)
+        # 预处理确保图像是二值化的（二值化结果由分析上下文缓存）
+        if analysis is None:
+            analysis = ImageAnalysis(image)
         
         # 反转颜色：文字为白色(255)，背景为黑色(0)
-        binary = 255 - binary
+        binary = 255 - analysis.binary
+        # 反色图的距离变换、骨架与轮廓只在艺术评价中使用，由单独的分析上下文计算一次
+        inverted = ImageAnalysis(binary)
         
         # 1. 顿笔检测 - 笔画起始/结束处的宽度变化
-        pen_pressure_score = self.detect_pen_pressure(binary)
+        pen_pressure_score = self.detect_pen_pressure(binary, inverted)
         
         # 2. 笔锋检测 - 笔画末端的尖锐程度
-        stroke_tip_score = self.detect_stroke_tips(binary)
+        stroke_tip_score = self.detect_stroke_tips(binary, inverted)
         
         # 3. 笔画流畅度 - 曲率变化
-        stroke_fluency_score = self.detect_stroke_fluency(binary)
+        stroke_fluency_score = self.detect_stroke_fluency(binary, inverted)
         
         # 4. 墨色梯度检测
         ink_gradient_score = 0.0
@@ -68,11 +73,14 @@ class ArtEvaluator:
             "feedback": "，".join(feedback) if feedback else "笔画艺术表现良好"
         }
     
-    def detect_pen_pressure(self, image):
-        """检测顿笔特征"""
+    def detect_pen_pressure(self, image, analysis=None):
+        """检测顿笔特征（analysis 须基于 image）"""
         # 计算笔画宽度变化
-        dist_transform = cv2.distanceTransform(image, cv2.DIST_L2, 3)
-        dist_values = dist_transform[dist_transform > 0]
+        if analysis is not None:
+            dist_values = analysis.distance_values()
+        else:
+            dist_transform = cv2.distanceTransform(image, cv2.DIST_L2, 3)
+            dist_values = dist_transform[dist_transform > 0]
         
         if len(dist_values) == 0:
             return 0.0
@@ -84,10 +92,10 @@ class ArtEvaluator:
         # 较大的标准差表示有顿笔变化
         return min(1.0, width_std / (width_mean * 0.5))
     
-    def detect_stroke_tips(self, image):
+    def detect_stroke_tips(self, image, analysis=None):
         """检测笔锋特征"""
         # 使用骨架化找到笔画末端
-        skeleton = self.thin_font(image)
+        skeleton = analysis.skeleton() if analysis is not None else self.thin_font(image)
         endpoints = self.find_endpoints(skeleton)
         
         if len(endpoints) == 0:
@@ -115,9 +123,12 @@ class ArtEvaluator:
         
         return np.mean(tip_scores) if tip_scores else 0.0
     
-    def detect_stroke_fluency(self, image):
+    def detect_stroke_fluency(self, image, analysis=None):
         """检测笔画流畅度"""
-        contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        if analysis is not None:
+            contours = analysis.contours()
+        else:
+            contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
         if not contours:
             return 0.0
         
@@ -139,10 +150,7 @@ class ArtEvaluator:
     def thin_font(self, img):
         """骨架化方法"""
         _, binary = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
-        skeleton = cv2.ximgproc.thinning(
-            binary, 
-            thinningType=cv2.ximgproc.THINNING_ZHANGSUEN
-        )
+        skeleton = thinning(binary)
         return skeleton
     
     def find_endpoints(self, skeleton):
@@ -157,21 +165,8 @@ class ArtEvaluator:
         return endpoints
     
     def calculate_curvature(self, contour):
-        """计算轮廓的曲率"""
-        curvature = []
-        for i in range(1, len(contour)-1):
-            p1 = contour[i-1][0]
-            p2 = contour[i][0]
-            p3 = contour[i+1][0]
-            
-            # 计算曲率
-            v1 = p1 - p2
-            v2 = p3 - p2
-            cos_angle = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2) + 1e-5)
-            angle = np.arccos(np.clip(cos_angle, -1, 1))
-            curvature.append(float(angle))
-        
-        return curvature
+        """计算轮廓的曲率，返回数组"""
+        return contour_curvature(contour)
     
     def detect_ink_gradient(self, gray_image, binary_mask):
         """
@@ -208,20 +203,23 @@ class ArtEvaluator:
         """计算梯度变化的连贯性"""
         # 计算梯度方向一致性
         rows, cols = grad_mag.shape
-        coherence = 0
-        count = 0
         
         # 如果图像太小，直接返回0
         if rows < 3 or cols < 3:
             return 0.0
         
-        for i in range(1, rows-1):
-            for j in range(1, cols-1):
-                if grad_mag[i, j] > 0.3:
-                    # 检查8邻域内梯度方向是否一致
-                    local_grad = grad_mag[i-1:i+2, j-1:j+2]
-                    if np.std(local_grad) < 0.2:
-                        coherence += 1
-                    count += 1
-        
-        return coherence / count if count > 0 else 0
\ No newline at end of file
+        # 只统计内部像素中梯度较强的点
+        grad_mag = np.asarray(grad_mag, dtype=np.float64)
+        strong = grad_mag[1:-1, 1:-1] > 0.3
+        count = int(np.count_nonzero(strong))
+        if count == 0:
+            return 0
+        
+        # 3x3 邻域的9个平移视图，整幅图一次计算局部均值与标准差
+        shifts = [grad_mag[dy:rows-2+dy, dx:cols-2+dx] for dy in range(3) for dx in range(3)]
+        local_mean = sum(shifts) / 9.0
+        local_var = sum((shift - local_mean) ** 2 for shift in shifts) / 9.0
+        
+        # 检查8邻域内梯度方向是否一致
+        coherence = int(np.count_nonzero(strong & (np.sqrt(local_var) < 0.2)))
+        return coherence / count
\ No newline at end of file
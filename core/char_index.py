@@ -0,0 +1,145 @@
+import os
+import json
+import threading
+from .database import CalligraphyDB
+from .feature_store import FeatureStore
+
+def char_to_code(char):
+    """字符 -> 数据库使用的编码（4位以上大写十六进制Unicode码位，如 6C38）"""
+    return hex(ord(char))[2:].upper().zfill(4)
+
+def code_to_char(char_code):
+    """编码 -> 字符，无效编码返回 None"""
+    try:
+        return chr(int(char_code, 16))
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+class CharIndex:
+    """
+    字符与编码的双向索引
+    全局映射来自 builddata 生成的 base/char_map.json，
+    各字体数据库中存在的编码在首次查询时从特征存储（或数据库）加载一次
+    """
+    def __init__(self, base_dir="base", data_dir="data"):
+        self.base_dir = base_dir
+        self.data_dir = data_dir
+        self.code_map = {}   # 编码 -> 字符
+        self.char_map = {}   # 字符 -> 编码
+        self.style_codes = {}  # 字体样式 -> 数据库中存在的编码集合
+        self.style_versions = {}  # 字体样式 -> 加载编码集合时数据库文件的版本（修改时间与大小）
+        self._lock = threading.Lock()
+        self._load_char_map()
+    
+    def _load_char_map(self):
+        """读取 builddata 保存的全局字符映射（文件不存在时只依赖Unicode换算）"""
+        map_path = os.path.join(self.base_dir, "char_map.json")
+        if not os.path.exists(map_path):
+            return
+        try:
+            with open(map_path, "r", encoding="utf-8") as f:
+                global_map = json.load(f).get("global_map", {})
+        except (ValueError, OSError) as e:
+            print(f"读取字符映射失败: {str(e)}")
+            return
+        self._add(global_map.items())
+    
+    def _add(self, pairs):
+        for char_code, char in pairs:
+            self.code_map[char_code] = char
+            self.char_map.setdefault(char, char_code)
+    
+    def code(self, char):
+        """字符 -> 编码"""
+        char_code = self.char_map.get(char)
+        return char_code if char_code is not None else char_to_code(char)
+    
+    def char(self, char_code):
+        """编码 -> 字符，无效编码返回 None"""
+        char = self.code_map.get(char_code)
+        return char if char is not None else code_to_char(char_code)
+    
+    def db_path(self, font_style):
+        return os.path.join(self.data_dir, f"calligraphy_{font_style}.db")
+    
+    def codes(self, font_style):
+        """指定字体数据库中存在的全部编码（首次调用时加载，之后直接返回）"""
+        codes = self.style_codes.get(font_style)
+        if codes is None:
+            with self._lock:
+                codes = self.style_codes.get(font_style)
+                if codes is None:
+                    version = self._version(font_style)
+                    codes = self._load_codes(font_style)
+                    self.style_codes[font_style] = codes
+                    self.style_versions[font_style] = version
+        return codes
+    
+    def _version(self, font_style):
+        """数据库及特征存储文件的修改时间与大小，任一文件重建后随之改变"""
+        db_path = self.db_path(font_style)
+        version = []
+        for path in (db_path,) + tuple(FeatureStore.paths_for(db_path)):
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                version.append(None)
+        return tuple(version)
+    
+    def _load_codes(self, font_style):
+        """优先读取特征存储的索引，否则查询数据库；数据库不存在时为空集合"""
+        db_path = self.db_path(font_style)
+        pairs = []
+        if FeatureStore.exists(db_path):
+            store = FeatureStore.load(db_path)
+            if store.font_style == font_style:
+                pairs = list(zip(store.char_codes, store.characters))
+        if not pairs and os.path.exists(db_path):
+            db = CalligraphyDB(db_path, read_only=True)
+            try:
+                pairs = db.get_standard_char_codes(font_style)
+            finally:
+                db.close()
+        self._add(pairs)
+        return frozenset(char_code for char_code, _ in pairs)
+    
+    def has(self, font_style, char_code):
+        """字符是否存在于指定字体的数据库中"""
+        return char_code in self.codes(font_style)
+    
+    def refresh(self, font_style=None):
+        """数据库重建后清除已加载的编码集合"""
+        with self._lock:
+            if font_style is None:
+                self.style_codes.clear()
+                self.style_versions.clear()
+            else:
+                self.style_codes.pop(font_style, None)
+                self.style_versions.pop(font_style, None)
+    
+    def refresh_if_changed(self, font_style):
+        """数据库文件在加载后被重建（修改时间或大小变化）时清除该字体的编码集合，返回是否清除"""
+        with self._lock:
+            if font_style not in self.style_codes:
+                return False
+            if self.style_versions.get(font_style) == self._version(font_style):
+                return False
+        print(f"检测到 {font_style} 数据库已更新，重新加载字符编码")
+        self.refresh(font_style)
+        return True
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+def get_char_index(base_dir="base", data_dir="data"):
+    """进程内共享的字符索引，每组 (base_dir, data_dir) 创建一个"""
+    key = (os.path.abspath(base_dir), os.path.abspath(data_dir))
+    index = _indexes.get(key)
+    if index is None:
+        with _index_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = CharIndex(base_dir, data_dir)
+                _indexes[key] = index
+    return index
@@ -1,19 +1,66 @@
 import sqlite3
 import json
 import os
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
 class CalligraphyDB:
-    def __init__(self, db_path="data/calligraphy.db"):
+    def __init__(self, db_path="data/calligraphy.db", journal_mode=None, synchronous=None,
+                 read_only=False, immutable=False):
+        """
+        :param read_only: 只读模式（URI mode=ro），不执行建表语句，用于标准特征查询
+        :param immutable: 声明数据库文件不会被修改（发布的参考数据库），SQLite 跳过加锁与变更检测；隐含只读
+        """
         self.db_path = db_path
-        self.conn = None
-        self._initialize_db()
+        self.read_only = read_only or immutable
+        self.immutable = immutable
+        self._local = threading.local()  # 每个线程持有自己的连接
+        self._connections = []
+        self._lock = threading.Lock()
+        self._pragmas = []
+        
+        if self.read_only:
+            if not os.path.exists(db_path):
+                raise FileNotFoundError(f"数据库不存在: {db_path}")
+        else:
+            self._initialize_db()
+        
+        # 可选的日志模式与同步级别（构建数据库时使用 WAL + NORMAL）
+        if journal_mode or synchronous:
+            self.set_write_mode(journal_mode, synchronous)
+    
+    @property
+    def conn(self):
+        """当前线程的数据库连接，首次访问时创建，之后在该线程内复用"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+    
+    def _connect(self):
+        """创建新连接（只读模式使用 URI 打开）"""
+        if self.read_only:
+            uri = Path(self.db_path).absolute().as_uri() + "?mode=ro"
+            if self.immutable:
+                uri += "&immutable=1"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        
+        # 新连接沿用已设置的连接级参数（如 synchronous）
+        for pragma in self._pragmas:
+            conn.execute(pragma)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
     
     def _initialize_db(self):
         """初始化数据库"""
         # 确保目录存在
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        self.conn = sqlite3.connect(self.db_path)
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
         cursor = self.conn.cursor()
         
         # 创建标准字符特征表 - 修复表名错误
@@ -41,6 +88,26 @@ class CalligraphyDB:
         
         self.conn.commit()
     
+    def set_write_mode(self, journal_mode=None, synchronous=None):
+        """设置日志模式与同步级别（如 WAL / NORMAL），之后创建的连接同样生效"""
+        cursor = self.conn.cursor()
+        if journal_mode:
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        if synchronous:
+            pragma = f"PRAGMA synchronous={synchronous}"
+            cursor.execute(pragma)
+            self._pragmas.append(pragma)
+    
+    def _standard_char_row(self, char_code, character, font_style, features):
+        """将标准字符特征转换为数据库行"""
+        return (
+            char_code,
+            character,
+            font_style,
+            json.dumps(features["stroke"]),
+            json.dumps(features["structure"])
+        )
+    
     def insert_standard_char(self, char_code, character, font_style, features):
         """插入标准字符特征"""
         cursor = self.conn.cursor()
@@ -48,15 +115,37 @@ class CalligraphyDB:
         INSERT OR REPLACE INTO standard_chars 
         (char_code, character, font_style, stroke_features, structure_features)
         VALUES (?, ?, ?, ?, ?)
-        """, (
-            char_code,
-            character,
-            font_style,
-            json.dumps(features["stroke"]),
-            json.dumps(features["structure"])
-        ))
+        """, self._standard_char_row(char_code, character, font_style, features))
         self.conn.commit()
     
+    def insert_standard_chars(self, chars, batch_size=500):
+        """
+        批量插入标准字符特征
+        :param chars: 可迭代的 (char_code, character, font_style, features) 元组
+        :param batch_size: 每个事务写入的字符数
+        :return: 写入的字符数
+        """
+        count = 0
+        batch = []
+        for char_code, character, font_style, features in chars:
+            batch.append(self._standard_char_row(char_code, character, font_style, features))
+            if len(batch) >= batch_size:
+                count += self._write_standard_rows(batch)
+                batch = []
+        if batch:
+            count += self._write_standard_rows(batch)
+        return count
+    
+    def _write_standard_rows(self, rows):
+        """在单个事务中写入一批标准字符"""
+        with self.conn:
+            self.conn.executemany("""
+            INSERT OR REPLACE INTO standard_chars 
+            (char_code, character, font_style, stroke_features, structure_features)
+            VALUES (?, ?, ?, ?, ?)
+            """, rows)
+        return len(rows)
+    
     def get_standard_char_features(self, char_code, font_style="regular"):
         """获取标准字符特征"""
         cursor = self.conn.cursor()
@@ -74,7 +163,109 @@ class CalligraphyDB:
             }
         return None
     
+    def get_standard_chars_features(self, char_codes, font_style="regular"):
+        """一次查询获取多个标准字符的特征: {char_code: features}"""
+        char_codes = list(dict.fromkeys(char_codes))
+        result = {}
+        cursor = self.conn.cursor()
+        # SQLite 对参数个数有限制，按块查询
+        for start in range(0, len(char_codes), 500):
+            chunk = char_codes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"""
+            SELECT char_code, stroke_features, structure_features 
+            FROM standard_chars 
+            WHERE font_style=? AND char_code IN ({placeholders})
+            """, (font_style, *chunk))
+            for char_code, stroke, structure in cursor.fetchall():
+                result[char_code] = {
+                    "stroke": json.loads(stroke),
+                    "structure": json.loads(structure)
+                }
+        return result
+    
+    def insert_user_submission(self, file_path, char_code, score, features):
+        """保存用户作品的评价结果"""
+        self.conn.execute("""
+        INSERT INTO user_submissions (file_path, char_code, score, features)
+        VALUES (?, ?, ?, ?)
+        """, (file_path, char_code, score, json.dumps(features)))
+        self.conn.commit()
+    
+    def get_standard_char_codes(self, font_style="regular"):
+        """按编码顺序获取某字体全部字符编码（不解析特征）: [(char_code, character), ...]"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+        SELECT char_code, character 
+        FROM standard_chars 
+        WHERE font_style=?
+        ORDER BY char_code
+        """, (font_style,))
+        return cursor.fetchall()
+    
+    def get_all_standard_chars(self, font_style="regular"):
+        """按编码顺序获取某字体全部标准字符: [(char_code, character, features), ...]"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+        SELECT char_code, character, stroke_features, structure_features 
+        FROM standard_chars 
+        WHERE font_style=?
+        ORDER BY char_code
+        """, (font_style,))
+        
+        return [
+            (char_code, character, {
+                "stroke": json.loads(stroke),
+                "structure": json.loads(structure)
+            })
+            for char_code, character, stroke, structure in cursor.fetchall()
+        ]
+    
+    def close(self):
+        """关闭所有线程创建的数据库连接"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+class SubmissionWriter:
+    """
+    用户作品的独立写入器
+    单个后台线程持有唯一的读写连接，按提交顺序写入 user_submissions；
+    数据库切换为 WAL 模式，只读的标准特征查询不会被写入阻塞
+    """
+    def __init__(self, db_path="data/calligraphy.db"):
+        self.db_path = db_path
+        self._db = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="submission-writer")
+    
+    def _get_db(self):
+        """写入线程内延迟打开数据库"""
+        if self._db is None:
+            self._db = CalligraphyDB(self.db_path, journal_mode="WAL", synchronous="NORMAL")
+        return self._db
+    
+    def _write(self, file_path, char_code, score, features):
+        self._get_db().insert_user_submission(file_path, char_code, score, features)
+    
+    def submit(self, file_path, char_code, score, features):
+        """
+        排队保存用户作品，立即返回
+        :return: Future，写入失败时 result() 抛出 sqlite3.Error
+        """
+        return self._executor.submit(self._write, file_path, char_code, score, features)
+    
+    def flush(self):
+        """等待已排队的记录全部写入"""
+        self._executor.submit(lambda: None).result()
+    
+    def _close_db(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+    
     def close(self):
-        """关闭数据库连接"""
-        if self.conn:
-            self.conn.close()
\ No newline at end of file
+        """写完剩余记录后关闭连接"""
+        self._executor.submit(self._close_db)
+        self._executor.shutdown(wait=True)
\ No newline at end of file
@@ -1,15 +1,56 @@
 import numpy as np
 from .database import CalligraphyDB
+from .feature_store import FeatureStore, STROKE_KEYS
+
+def _clip_score(score):
+    """限制得分在0-1之间，与 max(0, min(1, x)) 的行为一致（NaN 视为 1）"""
+    return np.clip(np.where(np.isnan(score), 1.0, score), 0, 1)
 
 class CalligraphyEvaluator:
-    def __init__(self, db_path="data/calligraphy.db", font_style="regular"):
-        self.db = CalligraphyDB(db_path)
+    def __init__(self, db_path="data/calligraphy.db", font_style="regular", feature_store=None,
+                 feature_cache=None, read_only=True, immutable=False):
+        """
+        :param feature_store: 列式特征存储，默认自动加载数据库旁导出的文件
+        :param feature_cache: 可选的共享缓存（如 LRUCache），以 (font_style, char_code) 为键缓存解码后的标准特征
+        :param read_only: 以只读方式打开数据库，每个线程使用独立连接，可在线程池中并发评价
+        :param immutable: 数据库为发布的参考库且运行期间不会被修改
+        """
+        self.db = CalligraphyDB(db_path, read_only=read_only, immutable=immutable)
         self.font_style = font_style
+        self.feature_cache = feature_cache
+        
+        # 优先使用数据库旁导出的列式特征存储（内存映射，无需JSON解析）
+        self.feature_store = feature_store
+        if feature_store is None and FeatureStore.exists(db_path):
+            store = FeatureStore.load(db_path)
+            if store.font_style == font_style:
+                self.feature_store = store
+    
+    def get_standard_features(self, char_code):
+        """获取标准特征，依次读取缓存、特征存储和数据库"""
+        key = (self.font_style, char_code)
+        if self.feature_cache is not None:
+            features = self.feature_cache.get(key)
+            if features is not None:
+                return features
+        
+        if self.feature_store is not None and char_code in self.feature_store:
+            features = self.feature_store.get_features(char_code)
+        else:
+            features = self.db.get_standard_char_features(char_code, self.font_style)
+        
+        if features is not None and self.feature_cache is not None:
+            self.feature_cache.put(key, features)
+        return features
+    
+    def has_char(self, char_code):
+        """检查标准库中是否有该字符（结果会进入缓存，供随后的评价复用）"""
+        return self.get_standard_features(char_code) is not None
     
     def evaluate(self, features, char_code):
         """评价书法作品"""
         # 获取标准特征
-        standard_features = self.db.get_standard_char_features(char_code, self.font_style)
+        standard_features = self.get_standard_features(char_code)
         if not standard_features:
             return None
         
@@ -35,6 +76,89 @@ class CalligraphyEvaluator:
             "details": self.generate_details(features, standard_features)
         }
     
+    def evaluate_batch(self, items):
+        """
+        批量评价书法作品
+        :param items: [(features, char_code), ...]
+        :return: 与输入顺序一致的评价结果列表，找不到标准特征的项为 None
+        """
+        items = list(items)
+        standard = self.get_standard_features_batch([char_code for _, char_code in items])
+        
+        # 只对找到标准特征的项计算
+        found = [i for i, (_, char_code) in enumerate(items) if char_code in standard]
+        results = [None] * len(items)
+        if not found:
+            return results
+        
+        user_features = [items[i][0] for i in found]
+        standard_features = [standard[items[i][1]] for i in found]
+        for user, std in zip(user_features, standard_features):
+            self.check_grid(user["structure"], std["structure"])
+        
+        # 每行: 4个笔画特征 + N个网格密度 + N个网格偏移
+        user_matrix = np.vstack([FeatureStore.encode(f, np.float64) for f in user_features])
+        std_matrix = np.vstack([FeatureStore.encode(f, np.float64) for f in standard_features])
+        
+        stroke_scores = self.calculate_stroke_scores(user_matrix, std_matrix)
+        structure_scores = self.calculate_structure_scores(user_matrix, std_matrix)
+        total_scores = 0.6 * stroke_scores + 0.4 * structure_scores
+        
+        for row, i in enumerate(found):
+            results[i] = {
+                "total_score": float(total_scores[row]),
+                "stroke_score": float(stroke_scores[row]),
+                "structure_score": float(structure_scores[row]),
+                "details": self.generate_details(user_features[row], standard_features[row])
+            }
+        return results
+    
+    def get_standard_features_batch(self, char_codes):
+        """获取多个字符的标准特征: 特征存储中没有的字符用一次数据库查询获取"""
+        result = {}
+        missing = []
+        for char_code in dict.fromkeys(char_codes):
+            if self.feature_store is not None and char_code in self.feature_store:
+                result[char_code] = self.feature_store.get_features(char_code)
+            else:
+                missing.append(char_code)
+        if missing:
+            result.update(self.db.get_standard_chars_features(missing, self.font_style))
+        return result
+    
+    def calculate_stroke_scores(self, user, standard):
+        """按矩阵批量计算笔画得分（每行一个作品），公式与 calculate_stroke_score 相同"""
+        width_mean, width_std, curvature_mean = (STROKE_KEYS.index(key) for key in
+                                                 ("stroke_width_mean", "stroke_width_std", "curvature_mean"))
+        
+        # 宽度相似度
+        width_sim = 1 - np.abs(user[:, width_mean] - standard[:, width_mean]) / np.maximum(standard[:, width_mean], 1)
+        
+        # 宽度均匀性
+        width_uniformity = 1 - user[:, width_std] / np.maximum(standard[:, width_std], 1)
+        
+        # 曲率相似度
+        curvature_sim = 1 - np.abs(user[:, curvature_mean] - standard[:, curvature_mean]) / np.maximum(standard[:, curvature_mean], 0.1)
+        
+        # 组合得分
+        return _clip_score(0.4 * width_sim + 0.3 * width_uniformity + 0.3 * curvature_sim)
+    
+    def calculate_structure_scores(self, user, standard):
+        """按矩阵批量计算结构得分（每行一个作品），公式与 calculate_structure_score 相同"""
+        stroke_count = len(STROKE_KEYS)
+        cells = (user.shape[1] - stroke_count) // 2
+        density = slice(stroke_count, stroke_count + cells)
+        offset = slice(stroke_count + cells, stroke_count + 2 * cells)
+        
+        # 密度相似度
+        density_sim = 1 - np.abs(user[:, density] - standard[:, density])
+        
+        # 重心偏移相似度
+        offset_sim = 1 - np.abs(user[:, offset] - standard[:, offset])
+        
+        total_score = np.sum(0.6 * density_sim + 0.4 * offset_sim, axis=1)
+        return _clip_score(total_score / cells)
+    
     def calculate_stroke_score(self, user, standard):
         """计算笔画得分"""
         # 添加默认值处理
@@ -57,18 +181,31 @@ class CalligraphyEvaluator:
         return max(0, min(1, 0.4 * width_sim + 0.3 * width_uniformity + 0.3 * curvature_sim))
     
     def calculate_structure_score(self, user, standard):
-        """计算结构得分"""
-        total_score = 0
-        for i in range(9):
-            # 密度相似度
-            density_sim = 1 - abs(user[i]["density"] - standard[i]["density"])
-            
-            # 重心偏移相似度
-            offset_sim = 1 - abs(user[i]["center_offset"] - standard[i]["center_offset"])
-            
-            total_score += 0.6 * density_sim + 0.4 * offset_sim
-        
-        return max(0, min(1, total_score / 9))
+        """计算结构得分（网格数由特征本身决定，如九宫格为9）"""
+        self.check_grid(user, standard)
+        cells = len(standard)
+        
+        user_density = np.array([grid["density"] for grid in user], dtype=np.float64)
+        std_density = np.array([grid["density"] for grid in standard], dtype=np.float64)
+        user_offset = np.array([grid["center_offset"] for grid in user], dtype=np.float64)
+        std_offset = np.array([grid["center_offset"] for grid in standard], dtype=np.float64)
+        
+        # 密度相似度
+        density_sim = 1 - np.abs(user_density - std_density)
+        
+        # 重心偏移相似度
+        offset_sim = 1 - np.abs(user_offset - std_offset)
+        
+        total_score = float(np.sum(0.6 * density_sim + 0.4 * offset_sim))
+        return max(0, min(1, total_score / cells))
+    
+    def check_grid(self, user, standard):
+        """检查作品与标准字的结构网格划分是否一致"""
+        if len(user) != len(standard):
+            raise ValueError(
+                f"结构特征网格数不一致: 作品 {len(user)} 个, 标准字 {len(standard)} 个，"
+                "请使用与数据库构建时相同的网格设置"
+            )
     
     def generate_details(self, user, standard):
         """生成详细评价"""
@@ -81,7 +218,8 @@ class CalligraphyEvaluator:
             "structure": []
         }
         
-        for i in range(9):
+        self.check_grid(user["structure"], standard["structure"])
+        for i in range(len(standard["structure"])):
             details["structure"].append({
                 "density": (user["structure"][i]["density"], standard["structure"][i]["density"]),
                 "center_offset": (user["structure"][i]["center_offset"], standard["structure"][i]["center_offset"])
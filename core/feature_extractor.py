@@ -1,27 +1,42 @@
 import cv2
 import numpy as np
-from scipy.spatial import distance
+from .geometry import contour_curvature
+from .thinning import thinning, zhang_suen_thinning
+from .analysis import ImageAnalysis
+from .feature_store import STROKE_KEYS
+
+def _cell_indicator(bounds, length, dtype=np.float32):
+    """分段指示矩阵 (length, N)：第 i 个像素落在第 j 段时为1，分段求和即与其相乘"""
+    indicator = np.zeros((length, len(bounds) - 1), dtype=dtype)
+    for j, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        indicator[start:end, j] = 1
+    return indicator
 
 class FeatureExtractor:
-    def extract_stroke_features(self, img):
+    def __init__(self, grid_size=3):
+        # 结构分析的网格划分数（grid_size x grid_size，默认九宫格）
+        self.grid_size = grid_size
+    
+    def extract_stroke_features(self, img, analysis=None):
         """提取笔画特征"""
-        # 确保图像是二值化的
-        _, binary = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+        # 二值化、距离变换和骨架化由分析上下文按需计算并缓存
+        if analysis is None:
+            analysis = ImageAnalysis(img)
         
         # 计算距离变换
-        dist_transform = cv2.distanceTransform(binary, cv2.DIST_L2, 3)
+        dist_values = analysis.distance_values()
         
         # 骨架化
-        skeleton = self.thin_font(binary)
+        skeleton = analysis.skeleton()
         
         # 曲率分析
-        curvature = self.calculate_curvature(skeleton) if skeleton is not None else []
+        curvature = self.calculate_curvature(skeleton) if skeleton is not None else np.empty(0)
         
         return {
-            "stroke_width_mean": float(np.mean(dist_transform[dist_transform > 0])),
-            "stroke_width_std": float(np.std(dist_transform[dist_transform > 0])),
-            "curvature_mean": float(np.mean(curvature)) if curvature else 0.0,
-            "curvature_std": float(np.std(curvature)) if curvature else 0.0
+            "stroke_width_mean": float(np.mean(dist_values)),
+            "stroke_width_std": float(np.std(dist_values)),
+            "curvature_mean": float(np.mean(curvature)) if curvature.size else 0.0,
+            "curvature_std": float(np.std(curvature)) if curvature.size else 0.0
         }
     
     def thin_font(self, img):
@@ -29,157 +44,161 @@ class FeatureExtractor:
         # 确保图像是二值化的
         _, binary = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
         
-        # 使用更稳定的骨架化方法
-        skeleton = cv2.ximgproc.thinning(
-            binary, 
-            thinningType=cv2.ximgproc.THINNING_ZHANGSUEN
-        )
+        # 使用更稳定的骨架化方法（缺少 opencv-contrib 时自动使用查表实现）
+        skeleton = thinning(binary)
         
         return skeleton
     
     def zhang_suen_thinning(self, img):
-        """实现Zhang-Suen细化算法"""
+        """实现Zhang-Suen细化算法（查表向量化实现）"""
         # 确保图像是二值化的
         _, binary = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
-        
-        # 初始化细化后的图像
-        thinned = binary.copy()
-        
-        # 设置算法参数
-        height, width = thinned.shape[:2]
-        changed = True
-        
-        while changed:
-            changed = False
-            
-            # 第一步
-            markers = set()
-            for y in range(1, height - 1):
-                for x in range(1, width - 1):
-                    p2, p3, p4 = thinned[y-1, x], thinned[y-1, x+1], thinned[y, x+1]
-                    p5, p6, p7 = thinned[y+1, x+1], thinned[y+1, x], thinned[y+1, x-1]
-                    p8, p9, p1 = thinned[y, x-1], thinned[y-1, x-1], thinned[y, x]
-                    
-                    if p1 == 0:  # 只处理前景像素
-                        continue
-                    
-                    # 计算条件
-                    bp = sum([p2, p3, p4, p5, p6, p7, p8, p9])
-                    if bp < 2 or bp > 6:
-                        continue
-                    
-                    ap = 0
-                    transitions = [(p2, p3), (p3, p4), (p4, p5), (p5, p6), 
-                                  (p6, p7), (p7, p8), (p8, p9), (p9, p2)]
-                    for (a, b) in transitions:
-                        if a == 0 and b == 255:
-                            ap += 1
-                    
-                    if ap != 1:
-                        continue
-                    
-                    if p2 * p4 * p6 == 0 and p4 * p6 * p8 == 0:
-                        markers.add((y, x))
-            
-            # 删除标记点
-            for (y, x) in markers:
-                thinned[y, x] = 0
-                changed = True
-            
-            # 第二步
-            markers = set()
-            for y in range(1, height - 1):
-                for x in range(1, width - 1):
-                    p2, p3, p4 = thinned[y-1, x], thinned[y-1, x+1], thinned[y, x+1]
-                    p5, p6, p7 = thinned[y+1, x+1], thinned[y+1, x], thinned[y+1, x-1]
-                    p8, p9, p1 = thinned[y, x-1], thinned[y-1, x-1], thinned[y, x]
-                    
-                    if p1 == 0:  # 只处理前景像素
-                        continue
-                    
-                    # 计算条件
-                    bp = sum([p2, p3, p4, p5, p6, p7, p8, p9])
-                    if bp < 2 or bp > 6:
-                        continue
-                    
-                    ap = 0
-                    transitions = [(p2, p3), (p3, p4), (p4, p5), (p5, p6), 
-                                  (p6, p7), (p7, p8), (p8, p9), (p9, p2)]
-                    for (a, b) in transitions:
-                        if a == 0 and b == 255:
-                            ap += 1
-                    
-                    if ap != 1:
-                        continue
-                    
-                    if p2 * p4 * p8 == 0 and p2 * p6 * p8 == 0:
-                        markers.add((y, x))
-            
-            # 删除标记点
-            for (y, x) in markers:
-                thinned[y, x] = 0
-                changed = True
-        
-        return thinned
+        return zhang_suen_thinning(binary)
     
     def calculate_curvature(self, skeleton):
-        """计算曲率"""
+        """计算曲率，返回所有轮廓点曲率组成的数组"""
         contours, _ = cv2.findContours(skeleton, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
         if not contours:
-            return []
-        
-        curvature = []
-        for contour in contours:
-            for i in range(1, len(contour)-1):
-                p1 = contour[i-1][0]
-                p2 = contour[i][0]
-                p3 = contour[i+1][0]
-                
-                # 计算曲率
-                v1 = p1 - p2
-                v2 = p3 - p2
-                cos_angle = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2) + 1e-5)
-                angle = np.arccos(np.clip(cos_angle, -1, 1))
-                curvature.append(float(angle))  # 转换为Python float
-        
-        return curvature
+            return np.empty(0)
+        
+        return np.concatenate([contour_curvature(contour) for contour in contours])
     
-    def analyze_structure(self, img):
-        """九宫格结构分析"""
-        height, width = img.shape
-        grid_features = []
-        
-        for i in range(3):
-            for j in range(3):
-                # 提取当前网格区域
-                x1, x2 = j*width//3, (j+1)*width//3
-                y1, y2 = i*height//3, (i+1)*height//3
-                grid = img[y1:y2, x1:x2]
-                
-                # 计算网格内像素密度
-                density = np.sum(grid > 0) / (grid.size + 1e-5)
-                
-                # 计算重心偏移
-                offset = 0.0
-                if np.any(grid > 0):
-                    y_indices, x_indices = np.where(grid > 0)
-                    center_x = np.mean(x_indices) / grid.shape[1]
-                    center_y = np.mean(y_indices) / grid.shape[0]
-                    offset = distance.euclidean((center_x, center_y), (0.5, 0.5))
-                
-                grid_features.append({
-                    "density": float(density),
-                    "center_offset": float(offset)
-                })
-        
-        return grid_features
+    def analyze_structure(self, img, grid_size=None):
+        """网格结构分析（默认九宫格），返回按行优先排列的每个网格特征"""
+        density, offset = self.structure_grid(img, grid_size)
+        return [
+            {"density": float(d), "center_offset": float(o)}
+            for d, o in zip(density, offset)
+        ]
     
-    def extract_all_features(self, img):
+    def structure_grid(self, img, grid_size=None):
+        """
+        以分段指示矩阵的乘法（积分图的可分离形式）一次计算所有网格的像素密度与重心偏移
+        :param img: 单幅图像 (H, W)，或同尺寸图像组成的一批 (B, H, W)
+        :param grid_size: 网格划分数 N（N x N），默认使用 self.grid_size
+        :return: (density, center_offset)，单幅时长度均为 N*N，一批时为 (B, N*N)
+        """
+        n = grid_size or self.grid_size
+        img = np.asarray(img)
+        single = img.ndim == 2
+        if single:
+            img = img[None]
+        batch, height, width = img.shape
+        mask = (img > 0).astype(np.float32)
+        
+        # 网格边界与原先的 j*width//N 切分一致
+        ys = np.arange(n + 1) * height // n
+        xs = np.arange(n + 1) * width // n
+        
+        row_cells = _cell_indicator(ys, height)
+        col_cells = _cell_indicator(xs, width)
+        
+        # 每个行带内各列的像素数 (B, N, W)，每个列带内各行的像素数 (B, H, N)
+        # 均为不超过边长的整数，float32 矩阵乘法结果精确，整批合并为一次乘法
+        band_cols = (row_cells.T @ mask).astype(np.float64)
+        band_rows = (mask.reshape(-1, width) @ col_cells).reshape(batch, height, n).astype(np.float64)
+        
+        # 各网格的像素数与x、y坐标和 (B, N, N)
+        col_cells = col_cells.astype(np.float64)
+        count = band_cols @ col_cells
+        sum_x = band_cols @ (col_cells * np.arange(width)[:, None])
+        sum_y = (row_cells.T * np.arange(height)) @ band_rows
+        
+        y1, cell_height = ys[:-1, None], np.diff(ys)[:, None]
+        x1, cell_width = xs[None, :-1], np.diff(xs)[None, :]
+        
+        # 计算网格内像素密度
+        density = count / (cell_height * cell_width + 1e-5)
+        
+        # 计算重心偏移（网格内局部坐标的均值，归一化到网格尺寸）
+        with np.errstate(divide="ignore", invalid="ignore"):
+            center_x = (sum_x - x1 * count) / count / cell_width
+            center_y = (sum_y - y1 * count) / count / cell_height
+            offset = np.sqrt((center_x - 0.5) ** 2 + (center_y - 0.5) ** 2)
+        offset = np.where(count > 0, offset, 0.0)
+        
+        density, offset = density.reshape(batch, -1), offset.reshape(batch, -1)
+        if single:
+            return density[0], offset[0]
+        return density, offset
+    
+    def extract_all_features(self, img, analysis=None):
         """提取所有特征"""
-        stroke_features = self.extract_stroke_features(img)
+        stroke_features = self.extract_stroke_features(img, analysis)
         structure_features = self.analyze_structure(img)
         
         return {
             "stroke": stroke_features,
             "structure": structure_features
+        }
+    
+    def feature_dtype(self, grid_size=None):
+        """批量特征的结构化类型：每个笔画特征一个字段，网格密度与重心偏移为长度 N*N 的子数组"""
+        cells = (grid_size or self.grid_size) ** 2
+        return np.dtype(
+            [(key, np.float32) for key in STROKE_KEYS]
+            + [("density", np.float32, (cells,)), ("center_offset", np.float32, (cells,))]
+        )
+    
+    def extract_all_features_batch(self, images, analyses=None):
+        """
+        批量提取特征，结果与逐幅调用 extract_all_features 一致（float32 精度）
+        距离变换、骨架与曲率逐幅计算（骨架细化只处理各自的墨迹范围，逐幅更快），
+        笔画宽度统计与网格结构在整批上向量化计算
+        :param images: N x H x W 的预处理图像（如 ImagePreprocessor.preprocess_batch 的结果）
+        :param analyses: 可选，与 images 一一对应的 ImageAnalysis，复用其中已计算的结果
+        :return: 长度为 N 的结构化 float32 数组，字段见 feature_dtype
+        """
+        images = np.asarray(images)
+        if images.dtype != np.uint8:
+            images = images.astype(np.uint8)
+        count = len(images)
+        features = np.zeros(count, dtype=self.feature_dtype())
+        if count == 0:
+            return features
+        
+        # 与 ImageAnalysis.binary 相同的阈值，整批按一幅 (N*H, W) 图像一次完成
+        height, width = images.shape[1:]
+        _, binary = cv2.threshold(images.reshape(count * height, width), 127, 255, cv2.THRESH_BINARY)
+        binary = binary.reshape(images.shape)
+        dist = np.empty(images.shape, dtype=np.float32)
+        for i in range(count):
+            if analyses is not None:
+                dist[i] = analyses[i].distance_transform()
+                skeleton = analyses[i].skeleton()
+            else:
+                dist[i] = cv2.distanceTransform(binary[i], cv2.DIST_L2, 3)
+                skeleton = thinning(binary[i])
+            curvature = self.calculate_curvature(skeleton)
+            if curvature.size:
+                features["curvature_mean"][i] = np.mean(curvature)
+                features["curvature_std"][i] = np.std(curvature)
+        
+        # 距离变换中大于0的值按图像顺序排列，分段求均值与标准差（无笔画时为 nan，与 np.mean 空数组一致）
+        stroke = dist > 0
+        pixels = stroke.sum(axis=(1, 2))
+        values = dist[stroke].astype(np.float64)
+        starts = np.concatenate(([0], np.cumsum(pixels)[:-1]))
+        has_ink = pixels > 0
+        mean = np.full(count, np.nan)
+        std = np.full(count, np.nan)
+        if has_ink.any():
+            sums = np.add.reduceat(values, starts[has_ink])
+            mean[has_ink] = sums / pixels[has_ink]
+            deviation = values - np.repeat(mean[has_ink], pixels[has_ink])
+            std[has_ink] = np.sqrt(np.add.reduceat(deviation ** 2, starts[has_ink]) / pixels[has_ink])
+        features["stroke_width_mean"] = mean
+        features["stroke_width_std"] = std
+        
+        features["density"], features["center_offset"] = self.structure_grid(images)
+        return features
+    
+    def record_to_features(self, record):
+        """批量结果中的一行还原为 extract_all_features 的字典格式（供评价器使用）"""
+        return {
+            "stroke": {key: float(record[key]) for key in STROKE_KEYS},
+            "structure": [
+                {"density": float(d), "center_offset": float(o)}
+                for d, o in zip(record["density"], record["center_offset"])
+            ]
         }
\ No newline at end of file
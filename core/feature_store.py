@@ -0,0 +1,140 @@
+import os
+import json
+import numpy as np
+
+# 笔画特征列的顺序
+STROKE_KEYS = ("stroke_width_mean", "stroke_width_std", "curvature_mean", "curvature_std")
+
+class FeatureStore:
+    """
+    标准字特征的列式存储
+    每种字体一个 float32 矩阵（每行一个字符: 4个笔画特征 + N个网格密度 + N个网格偏移），
+    配合 char_code -> 行号 的索引，从SQLite数据库导出后以内存映射方式加载
+    """
+    def __init__(self, matrix, char_codes, characters, font_style, grid_cells, preprocess=None):
+        self.matrix = matrix
+        self.char_codes = list(char_codes)
+        self.characters = list(characters)
+        self.font_style = font_style
+        self.grid_cells = grid_cells
+        self.preprocess = preprocess  # 构建标准库时的预处理参数与网格数（ProcessingPipeline.config），旧版导出为 None
+        self.index = {code: row for row, code in enumerate(self.char_codes)}
+    
+    def __len__(self):
+        return len(self.char_codes)
+    
+    def __contains__(self, char_code):
+        return char_code in self.index
+    
+    @staticmethod
+    def paths_for(db_path):
+        """数据库对应的特征矩阵与索引文件路径"""
+        base = os.path.splitext(db_path)[0]
+        return base + ".features.npy", base + ".features.json"
+    
+    @classmethod
+    def exists(cls, db_path):
+        """检查数据库是否已导出特征存储"""
+        return all(os.path.exists(path) for path in cls.paths_for(db_path))
+    
+    @staticmethod
+    def encode(features, dtype=np.float32):
+        """将特征字典编码为一行向量（默认 float32）"""
+        structure = features["structure"]
+        row = [features["stroke"].get(key, 0.0) for key in STROKE_KEYS]
+        row += [grid["density"] for grid in structure]
+        row += [grid["center_offset"] for grid in structure]
+        return np.array(row, dtype=dtype)
+    
+    def decode(self, row):
+        """将一行向量还原为特征字典"""
+        row = row.tolist()
+        stroke_count = len(STROKE_KEYS)
+        densities = row[stroke_count:stroke_count + self.grid_cells]
+        offsets = row[stroke_count + self.grid_cells:]
+        return {
+            "stroke": dict(zip(STROKE_KEYS, row[:stroke_count])),
+            "structure": [
+                {"density": density, "center_offset": offset}
+                for density, offset in zip(densities, offsets)
+            ]
+        }
+    
+    def vector(self, char_code):
+        """获取字符的特征向量（矩阵中的一行），不存在时返回 None"""
+        row = self.index.get(char_code)
+        return None if row is None else self.matrix[row]
+    
+    def get_features(self, char_code):
+        """获取字符的特征字典，不存在时返回 None"""
+        row = self.vector(char_code)
+        return None if row is None else self.decode(row)
+    
+    def preprocess_mismatch(self, config):
+        """
+        与构建标准库时的预处理参数不同的项
+        :param config: 评价时的 ProcessingPipeline.config()
+        :return: 不同的参数名列表（未记录构建参数时为空）
+        """
+        if self.preprocess is None:
+            return []
+        keys = set(self.preprocess) | set(config)
+        return sorted(key for key in keys if self.preprocess.get(key) != config.get(key))
+    
+    def get_character(self, char_code):
+        """获取编码对应的字符"""
+        row = self.index.get(char_code)
+        return None if row is None else self.characters[row]
+    
+    @classmethod
+    def export(cls, db, font_style, preprocess=None):
+        """
+        从数据库导出特征存储（写入数据库文件旁的 .features.npy / .features.json）
+        :param db: CalligraphyDB 实例
+        :param preprocess: 构建时的预处理参数与网格数（ProcessingPipeline.config），写入索引
+        :return: 导出的 FeatureStore
+        """
+        char_codes, characters, rows = [], [], []
+        for char_code, character, features in db.get_all_standard_chars(font_style):
+            char_codes.append(char_code)
+            characters.append(character)
+            rows.append(cls.encode(features))
+        
+        grid_cells = (len(rows[0]) - len(STROKE_KEYS)) // 2 if rows else 0
+        if any(len(row) != len(STROKE_KEYS) + 2 * grid_cells for row in rows):
+            raise ValueError("数据库中的结构特征网格数不一致，无法导出特征存储")
+        matrix = np.vstack(rows) if rows else np.zeros((0, len(STROKE_KEYS)), dtype=np.float32)
+        
+        matrix_path, index_path = cls.paths_for(db.db_path)
+        index = {
+            "font_style": font_style,
+            "grid_cells": grid_cells,
+            "stroke_keys": list(STROKE_KEYS),
+            "char_codes": char_codes,
+            "characters": characters,
+            "preprocess": preprocess
+        }
+        
+        # 先写临时文件再替换，避免读取方看到不完整的文件
+        with open(matrix_path + ".tmp", "wb") as f:
+            np.save(f, matrix)
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(matrix_path + ".tmp", matrix_path)
+        os.replace(index_path + ".tmp", index_path)
+        
+        return cls(matrix, char_codes, characters, font_style, grid_cells, preprocess)
+    
+    @classmethod
+    def load(cls, db_path, mmap=True):
+        """加载数据库对应的特征存储，默认以只读内存映射方式打开矩阵"""
+        matrix_path, index_path = cls.paths_for(db_path)
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        
+        if tuple(index.get("stroke_keys", ())) != STROKE_KEYS:
+            raise ValueError(f"特征存储格式不匹配: {index_path}")
+        
+        matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+        return cls(matrix, index["char_codes"], index["characters"],
+                   index["font_style"], index["grid_cells"], index.get("preprocess"))
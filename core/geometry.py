@@ -0,0 +1,21 @@
+import numpy as np
+
+def contour_curvature(contour):
+    """
+    计算轮廓上每个内部点的转角（弧度）
+    :param contour: cv2.findContours 返回的单个轮廓 (N, 1, 2)
+    :return: 长度为 N-2 的 float64 数组
+    """
+    points = np.asarray(contour, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3:
+        return np.empty(0, dtype=np.float64)
+    
+    # 用平移视图一次得到所有相邻点构成的向量
+    v1 = points[:-2] - points[1:-1]
+    v2 = points[2:] - points[1:-1]
+    
+    # 计算曲率
+    dot = np.einsum("ij,ij->i", v1, v2)
+    norms = np.linalg.norm(v1, axis=1) * np.linalg.norm(v2, axis=1)
+    cos_angle = dot / (norms + 1e-5)
+    return np.arccos(np.clip(cos_angle, -1, 1))
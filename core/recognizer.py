@@ -0,0 +1,70 @@
+import numpy as np
+from .feature_store import FeatureStore, STROKE_KEYS
+
+class CharacterRecognizer:
+    """
+    基于标准特征库的本地字符识别（不依赖OCR）
+    将作品特征与特征存储中的全部字符做向量化距离比较，返回最相似的前k个候选
+    """
+    def __init__(self, feature_store, stroke_weight=0.1, structure_weight=0.9):
+        self.store = feature_store
+        matrix = np.array(feature_store.matrix, dtype=np.float32)
+        
+        # 按列标准化，避免量纲较大的笔画宽度列主导距离
+        valid = np.all(np.isfinite(matrix), axis=1)
+        self.mean = matrix[valid].mean(axis=0) if valid.any() else np.zeros(matrix.shape[1], np.float32)
+        scale = matrix[valid].std(axis=0) if valid.any() else np.ones(matrix.shape[1], np.float32)
+        self.scale = np.where(scale > 1e-6, scale, 1.0).astype(np.float32)
+        
+        # 笔画宽度主要反映书写风格而非字形，识别时以结构特征为主
+        stroke_count = len(STROKE_KEYS)
+        structure_count = matrix.shape[1] - stroke_count
+        weights = np.empty(matrix.shape[1], dtype=np.float32)
+        weights[:stroke_count] = stroke_weight / stroke_count
+        weights[stroke_count:] = structure_weight / max(structure_count, 1)
+        self.sqrt_weights = np.sqrt(weights)
+        
+        # 预先计算标准化后的矩阵及其平方范数，识别时只需一次矩阵向量乘法
+        normalized = (matrix - self.mean) / self.scale * self.sqrt_weights
+        normalized[~valid] = 0
+        self.normalized = normalized
+        self.squared_norms = np.einsum("ij,ij->i", normalized, normalized)
+        self.squared_norms[~valid] = np.inf
+    
+    @classmethod
+    def from_db_path(cls, db_path, **kwargs):
+        """加载数据库旁导出的特征存储并创建识别器"""
+        return cls(FeatureStore.load(db_path), **kwargs)
+    
+    def distances(self, features):
+        """作品特征到所有标准字符的加权平方距离"""
+        vector = FeatureStore.encode(features)
+        if len(vector) != self.normalized.shape[1]:
+            raise ValueError(
+                f"特征维度不一致: 作品 {len(vector)} 列, 特征库 {self.normalized.shape[1]} 列，"
+                "请使用与数据库构建时相同的网格设置"
+            )
+        vector = (vector - self.mean) / self.scale * self.sqrt_weights
+        vector = np.nan_to_num(vector)
+        return self.squared_norms - 2 * (self.normalized @ vector) + vector @ vector
+    
+    def recognize(self, features, top_k=5):
+        """
+        识别作品中的字符
+        :return: 按距离从小到大排列的候选列表 [{"char_code", "character", "distance"}, ...]
+        """
+        distances = self.distances(features)
+        top_k = min(top_k, len(distances))
+        if top_k <= 0:
+            return []
+        
+        candidates = np.argpartition(distances, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(distances[candidates])]
+        return [
+            {
+                "char_code": self.store.char_codes[row],
+                "character": self.store.characters[row],
+                "distance": float(max(distances[row], 0.0))
+            }
+            for row in candidates if np.isfinite(distances[row])
+        ]
@@ -1,42 +1,143 @@
 from utils.preprocessor import ImagePreprocessor
 from core.feature_extractor import FeatureExtractor
+from core.analysis import ImageAnalysis
+from utils.feature_cache import FeatureCache
 import os
+import json
 import hashlib
-import joblib
 import numpy as np
 
 class ProcessingPipeline:
-    def __init__(self, cache_dir="cache"):
+    def __init__(self, cache_dir="cache", grid_size=3, cache_bitmaps=True,
+                 cache_max_entries=50000, cache_max_mb=256, stat_keys=False, roi=False):
+        """
+        :param cache_dir: 特征缓存目录（缓存为其中的单个 features.db 文件），None 时不使用磁盘缓存
+        :param cache_bitmaps: 缓存中是否保存压缩的预处理图，否则命中时只跳过特征提取
+        :param cache_max_entries: 缓存条数上限，超出时淘汰最久未使用的条目
+        :param cache_max_mb: 缓存容量上限（MB）
+        :param stat_keys: 以 (路径, 大小, 修改时间, inode) 记录内容哈希，文件未变化时不读取文件即可命中缓存
+        :param roi: 墨迹区域优先的预处理（见 ImagePreprocessor），标准库与评价须使用相同设置
+        """
         self.cache_dir = cache_dir
-        os.makedirs(cache_dir, exist_ok=True)
-        self.preprocessor = ImagePreprocessor()
-        self.extractor = FeatureExtractor()
+        self.stat_keys = stat_keys
+        self.cache = None
+        if cache_dir:
+            self.cache = FeatureCache(
+                os.path.join(cache_dir, "features.db"),
+                max_entries=cache_max_entries,
+                max_bytes=cache_max_mb * 1024 * 1024,
+                store_bitmap=cache_bitmaps
+            )
+        self.preprocessor = ImagePreprocessor(roi=roi)
+        self.extractor = FeatureExtractor(grid_size=grid_size)
     
-    def process_image(self, image_path):
-        """处理单个图像：预处理 + 特征提取"""
-        # 生成缓存键
-        with open(image_path, "rb") as f:
-            file_content = f.read()
-        hash_key = hashlib.md5(file_content).hexdigest()
-        cache_file = os.path.join(self.cache_dir, f"{hash_key}.pkl")
+    def config(self):
+        """影响特征的全部参数：预处理参数与网格数（记录在特征存储中，评价时与标准库对照）"""
+        return dict(self.preprocessor.config(), grid_size=self.extractor.grid_size)
+    
+    def cache_config(self):
+        """缓存键中的配置部分：预处理参数与网格数不同的结果分别缓存，互不覆盖"""
+        return json.dumps(self.config(), sort_keys=True)
+    
+    @staticmethod
+    def content_hash(data):
+        """图像内容哈希（BLAKE2b，比 MD5 更快）"""
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+    
+    @staticmethod
+    def stat_key(image_path):
+        """文件属性键：路径、大小、修改时间与 inode 都不变时视为同一文件"""
+        st = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}|{st.st_size}|{st.st_mtime_ns}|{st.st_ino}"
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def process_image(self, image_path, with_original=True):
+        """
+        处理单个图像：预处理 + 特征提取
+        文件只读取一次并从内存解码，结果中的 original 为原始灰度图（供墨色分析使用）
+        :param with_original: 为 False 时，缓存命中（含预处理图）可不读取文件，original 为 None
+        """
+        if self.cache is None:
+            original = self.preprocessor.load_image(image_path, self.preprocessor.decode_side())
+            return self.process_array(original)
+        
+        # 生成缓存键：优先使用文件属性键，否则读取文件计算内容哈希
+        data = None
+        hash_key = None
+        stat_key = self.stat_key(image_path) if self.stat_keys else None
+        if stat_key:
+            hash_key = self.cache.get_alias(stat_key)
+        if hash_key is None:
+            data = self.read_file(image_path)
+            hash_key = self.content_hash(data)
+            if stat_key:
+                self.cache.put_alias(stat_key, hash_key)
+        config = self.cache_config()
         
         # 检查缓存
-        if os.path.exists(cache_file):
-            try:
-                return joblib.load(cache_file)
-            except:
-                # 缓存文件损坏，重新处理
-                pass
+        cached = self.cache.get(hash_key, config)
+        if cached is not None and cached[1] is not None and not with_original:
+            features, img = cached
+            return {
+                "preprocessed": img,
+                "features": features,
+                "analysis": ImageAnalysis(img),
+                "original": None
+            }
+        
+        # 从已读取的字节解码（属性键命中时才需要读取文件）
+        if data is None:
+            data = self.read_file(image_path)
+        try:
+            original = self.preprocessor.decode(data, self.preprocessor.decode_side())
+        except ValueError as e:
+            raise ValueError(f"无法加载图像 {image_path}: {str(e)}")
+        
+        if cached is not None:
+            features, img = cached
+            if img is None:
+                # 未保存预处理图时重新预处理（跳过耗时的特征提取）
+                img = self.preprocessor.preprocess(original)
+            original = self.preprocessor.to_grayscale(self.preprocessor.reduce(original))
+            # 分析上下文不写入缓存，命中后重新创建（按需计算）
+            return {
+                "preprocessed": img,
+                "features": features,
+                "analysis": ImageAnalysis(img),
+                "original": original
+            }
         
         # 无缓存则处理
-        img = self.preprocessor.preprocess(image_path)
-        features = self.extractor.extract_all_features(img)
+        result = self.process_array(original)
         
-        result = {
+        # 保存缓存
+        self.cache.put(hash_key, config, result["features"], result["preprocessed"])
+        return result
+    
+    def read_file(self, image_path):
+        """读取图像文件的全部字节"""
+        with open(image_path, "rb") as f:
+            return f.read()
+    
+    def process_array(self, image):
+        """处理内存中的图像（或图像路径），不读写缓存"""
+        if isinstance(image, str):
+            image = self.preprocessor.load_image(image, self.preprocessor.decode_side())
+        # 大图先缩小到工作分辨率，原始灰度图与预处理使用同一尺寸；
+        # 墨迹区域优先时预处理从原分辨率裁剪，原始灰度图仍为工作分辨率
+        reduced = self.preprocessor.reduce(image)
+        img = self.preprocessor.preprocess(image if self.preprocessor.roi else reduced)
+        analysis = ImageAnalysis(img)
+        features = self.extractor.extract_all_features(img, analysis)
+        
+        return {
             "preprocessed": img,
-            "features": features
+            "features": features,
+            "analysis": analysis,  # 中间结果，供艺术评价复用
+            "original": self.preprocessor.to_grayscale(reduced)  # 原始灰度图，供墨色分析使用
         }
-        
-        # 保存缓存
-        joblib.dump(result, cache_file)
-        return result
\ No newline at end of file
+    
+    def close(self):
+        """关闭特征缓存"""
+        if self.cache is not None:
+            self.cache.close()
\ No newline at end of file
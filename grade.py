@@ -0,0 +1,474 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import traceback
+from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from do import ProcessingPipeline
+from core.evaluator import CalligraphyEvaluator
+from core.art import ArtEvaluator
+from core.recognizer import CharacterRecognizer
+from core.char_index import char_to_code, code_to_char
+from utils.segmenter import PageSegmenter
+
+# 支持评价的图片格式
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+# CSV 输出的列
+CSV_FIELDS = ["file", "char_code", "character", "total_score", "stroke_score",
+              "structure_score", "art_score", "feedback", "error"]
+
+# 整页评价时 CSV 每行对应一个格子
+PAGE_CSV_FIELDS = ["file", "row", "col", "bbox"] + CSV_FIELDS[1:]
+
+def to_char_code(label):
+    """将单个字符或十六进制编码统一为数据库使用的编码（如 6C38）"""
+    label = label.strip()
+    if len(label) == 1:
+        return char_to_code(label)
+    return label.upper()
+
+class CalligraphyGrader:
+    """
+    无界面评价器：预处理、识别、笔画结构评价与艺术评价
+    评价器、特征存储与数据库连接在创建时加载一次，之后对每张图片复用
+    """
+    def __init__(self, font_style="regular", db_dir="data", grid_size=None, cache_dir=None,
+                 art=True, top_k=5, roi=None):
+        """
+        :param grid_size: 结构分析网格数，默认与特征存储一致（无特征存储时为 3）
+        :param cache_dir: 特征缓存目录，None 表示不缓存（批量评价的图片通常只处理一次）
+        :param art: 是否进行艺术评价
+        :param top_k: 未指定字符时保留的识别候选数
+        :param roi: 墨迹区域优先的预处理，默认与特征存储中记录的构建参数一致
+        :raises ValueError: 预处理参数与构建标准库时记录的不一致
+        """
+        self.font_style = font_style
+        self.db_path = os.path.join(db_dir, f"calligraphy_{font_style}.db")
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(
+                f"未找到{font_style}字体的数据库: {self.db_path}，"
+                f"请先运行 modelapp.py --style {font_style} 构建数据库"
+            )
+        
+        self.evaluator = CalligraphyEvaluator(self.db_path, font_style)
+        store = self.evaluator.feature_store
+        if grid_size is None:
+            grid_size = int(round(store.grid_cells ** 0.5)) if store is not None else 3
+        if roi is None:
+            roi = bool(store.preprocess.get("roi")) if store is not None and store.preprocess else False
+        self.pipeline = ProcessingPipeline(cache_dir=cache_dir, grid_size=grid_size, roi=roi)
+        mismatch = store.preprocess_mismatch(self.pipeline.config()) if store is not None else []
+        if mismatch:
+            self.evaluator.close()
+            raise ValueError(
+                f"预处理参数与构建{font_style}标准库时不一致: {', '.join(mismatch)}，"
+                f"请去掉相应参数使用构建时的设置，或重新构建数据库"
+            )
+        self.art_evaluator = ArtEvaluator() if art else None
+        self.top_k = top_k
+        self.recognizer = None
+    
+    def get_recognizer(self):
+        """首次需要识别时创建本地识别器"""
+        if self.recognizer is None:
+            if self.evaluator.feature_store is None:
+                raise ValueError("未找到特征存储，无法识别字符，请指定字符或运行 modelapp.py --export-only")
+            self.recognizer = CharacterRecognizer(self.evaluator.feature_store)
+        return self.recognizer
+    
+    def grade(self, image_path, char_code=None, details=False):
+        """
+        评价单张图片
+        :param char_code: 已知字符编码，None 时使用本地识别的第一候选
+        :param details: 是否在结果中包含逐项对比
+        :return: 结果字典（失败时包含 error）
+        """
+        record = {"file": image_path, "char_code": char_code}
+        result = self.pipeline.process_image(image_path)
+        return self._score(record, result, char_code, details)
+    
+    def grade_array(self, gray, char_code=None, details=False):
+        """评价内存中的灰度图（如整页切分出的单字），不读写缓存"""
+        record = {"char_code": char_code}
+        result = self.pipeline.process_array(gray)
+        return self._score(record, result, char_code, details)
+    
+    def _score(self, record, result, char_code, details):
+        """识别（未指定字符时）、评价并加入艺术评价（墨色分析使用结果中的原始灰度图）"""
+        features = result["features"]
+        
+        if char_code is None:
+            candidates = self.get_recognizer().recognize(features, self.top_k)
+            record["candidates"] = [
+                {"character": c["character"], "distance": round(float(c["distance"]), 4)}
+                for c in candidates
+            ]
+            char_code = candidates[0]["char_code"] if candidates else None
+            record["char_code"] = char_code
+        
+        evaluation = self.evaluator.evaluate(features, char_code) if char_code else None
+        if not evaluation:
+            record["error"] = f"标准字符不存在: {char_code}"
+            return record
+        record["character"] = code_to_char(char_code)
+        
+        # 只有当笔画和结构得分都超过0.5时才进行艺术评价，与界面一致
+        art_evaluation = {
+            "art_score": 0.0,
+            "feedback": "笔画或结构得分过低，不进行艺术评价"
+        }
+        if (self.art_evaluator is not None and
+                evaluation["stroke_score"] > 0.5 and evaluation["structure_score"] > 0.5):
+            art_evaluation = self.art_evaluator.evaluate_artistic_features(
+                result["preprocessed"], result["original"], analysis=result.get("analysis")
+            )
+            # 将艺术得分纳入总分（权重30%）
+            evaluation["total_score"] = (
+                0.7 * evaluation["total_score"] +
+                0.3 * art_evaluation["art_score"]
+            )
+        
+        record.update({
+            "total_score": float(evaluation["total_score"]),
+            "stroke_score": float(evaluation["stroke_score"]),
+            "structure_score": float(evaluation["structure_score"]),
+            "art_score": float(art_evaluation["art_score"]),
+            "feedback": art_evaluation["feedback"]
+        })
+        if details:
+            record["details"] = evaluation["details"]
+        return record
+    
+    def grade_page(self, image_path, text=None, method="auto", workers=4, details=False):
+        """
+        评价整页书写：只解码一次，切分为单字后在线程池中并行评价
+        :param text: 按阅读顺序书写的已知文字（忽略空白），依次对应非空格子；不指定时逐字识别
+        :param method: 切分方式，见 PageSegmenter
+        :param workers: 并行评价的线程数（OpenCV 计算期间释放 GIL）
+        :return: 整页报告，包含每个格子的结果与汇总
+        """
+        gray = self.pipeline.preprocessor.load_image(image_path)
+        report = self.grade_page_array(gray, text, method, workers, details)
+        return {"file": image_path, **report}
+    
+    def grade_page_array(self, gray, text=None, method="auto", workers=4, details=False, executor=None):
+        """
+        评价内存中的整页灰度图，参数与返回值同 grade_page（不含 file）
+        :param executor: 多页共用的线程池，指定时单字任务提交到该线程池，忽略 workers
+        """
+        used_method, cells = PageSegmenter(method).segment(gray)
+        cells = [cell for cell in cells if not cell["empty"]]
+        
+        codes = [None] * len(cells)
+        if text:
+            chars = [ch for ch in text if not ch.isspace()]
+            if len(chars) != len(cells):
+                print(f"警告: 已知文字 {len(chars)} 个，切分出 {len(cells)} 个字，按顺序对应",
+                      file=sys.stderr)
+            for i, ch in enumerate(chars[:len(cells)]):
+                codes[i] = to_char_code(ch)
+        
+        def grade_cell(args):
+            cell, char_code = args
+            try:
+                record = self.grade_array(cell["image"], char_code, details)
+            except Exception as e:
+                record = {"char_code": char_code, "error": str(e)}
+            record.update({"row": cell["row"], "col": cell["col"], "bbox": list(cell["bbox"])})
+            return record
+        
+        if executor is not None:
+            records = list(executor.map(grade_cell, zip(cells, codes)))
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as page_executor:
+                records = list(page_executor.map(grade_cell, zip(cells, codes)))
+        
+        return {
+            "method": used_method,
+            "cells": records,
+            "summary": self.summarize(records)
+        }
+    
+    def summarize(self, records):
+        """汇总整页得分"""
+        graded = [r for r in records if "error" not in r]
+        summary = {"count": len(records), "graded": len(graded), "failed": len(records) - len(graded)}
+        for key in ("total_score", "stroke_score", "structure_score", "art_score"):
+            scores = np.array([r[key] for r in graded])
+            summary[f"mean_{key}"] = float(scores.mean()) if len(scores) else None
+        if graded:
+            best = max(graded, key=lambda r: r["total_score"])
+            worst = min(graded, key=lambda r: r["total_score"])
+            summary["best"] = {"character": best["character"], "total_score": best["total_score"]}
+            summary["worst"] = {"character": worst["character"], "total_score": worst["total_score"]}
+        return summary
+    
+    def close(self):
+        """关闭数据库连接"""
+        self.evaluator.close()
+
+# 工作进程内的评价器，由进程池初始化函数在每个进程中创建一次
+_worker_grader = None
+_worker_details = False
+
+def _init_worker(grader_args, details=False):
+    """进程池初始化：为当前工作进程创建常驻的评价器与只读数据库连接"""
+    global _worker_grader, _worker_details
+    _worker_grader = CalligraphyGrader(**grader_args)
+    _worker_details = details
+
+def _grade_task(task):
+    """评价一张图片（在工作进程中运行），异常转为结果中的错误信息"""
+    image_path, char_code = task
+    start = time.time()
+    try:
+        record = _worker_grader.grade(image_path, char_code, _worker_details)
+    except Exception as e:
+        record = {"file": image_path, "char_code": char_code,
+                  "error": str(e), "traceback": traceback.format_exc()}
+    record["seconds"] = round(time.time() - start, 4)
+    return record
+
+def collect_images(inputs):
+    """
+    展开输入为图片路径列表
+    :param inputs: 目录（递归查找图片）、图片文件或 @列表文件（每行一个路径）
+    """
+    paths = []
+    for item in inputs:
+        if item.startswith("@"):
+            with open(item[1:], "r", encoding="utf-8") as f:
+                paths.extend(line.strip() for line in f if line.strip())
+        elif os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                paths.extend(
+                    os.path.join(root, name) for name in sorted(files)
+                    if name.lower().endswith(IMAGE_EXTENSIONS)
+                )
+        else:
+            paths.append(item)
+    return paths
+
+def load_labels(labels_path):
+    """
+    读取已知字符标注
+    每行: 文件名或路径, 字符（或十六进制编码），以逗号或制表符分隔
+    """
+    labels = {}
+    with open(labels_path, "r", encoding="utf-8-sig") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            sep = "\t" if "\t" in line else ","
+            name, _, label = line.rpartition(sep)
+            if name and label.strip():
+                labels[name.strip()] = to_char_code(label)
+    return labels
+
+class ResultWriter:
+    """按扩展名将结果逐条写入 JSONL 或 CSV（无输出文件时写到标准输出）"""
+    def __init__(self, output=None, fields=CSV_FIELDS):
+        self.file = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+        self.csv = None
+        if output and output.lower().endswith(".csv"):
+            self.csv = csv.DictWriter(self.file, fieldnames=fields, extrasaction="ignore")
+            self.csv.writeheader()
+    
+    def write(self, record):
+        if self.csv is not None:
+            self.csv.writerow(record)
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+    
+    def write_page(self, report):
+        """整页报告：JSONL 每页一行，CSV 每个格子一行"""
+        if self.csv is None:
+            self.write(report)
+            return
+        for cell in report["cells"]:
+            self.csv.writerow({"file": report["file"], **cell})
+        self.file.flush()
+    
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+def grade_images(paths, font_style="regular", output=None, workers=1, char=None, labels=None,
+                 db_dir="data", grid_size=None, art=True, details=False, top_k=5, roi=None):
+    """
+    批量评价图片并流式写出结果
+    :param char: 所有图片共同的已知字符
+    :param labels: {文件名或路径: 字符编码}，优先于 char
+    :return: (成功数, 失败数, 总耗时)
+    """
+    global _worker_grader, _worker_details
+    labels = labels or {}
+    default_code = to_char_code(char) if char else None
+    tasks = [
+        (path, labels.get(path, labels.get(os.path.basename(path), default_code)))
+        for path in paths
+    ]
+    grader_args = {"font_style": font_style, "db_dir": db_dir, "grid_size": grid_size,
+                   "art": art, "top_k": top_k, "roi": roi}
+    
+    log = sys.stderr
+    print(f"待评价图片: {len(tasks)} | 字体: {font_style} | 工作进程: {workers}", file=log)
+    
+    # 先在主进程中加载一次，数据库缺失等错误在启动进程池前报告
+    grader = CalligraphyGrader(**grader_args)
+    
+    writer = ResultWriter(output)
+    pool = None
+    start_time = time.time()
+    success = failed = 0
+    try:
+        if workers > 1:
+            grader.close()
+            # 每个进程只加载一次评价器，任务按块分发以减少进程间通信
+            pool = Pool(processes=workers, initializer=_init_worker,
+                        initargs=(grader_args, details))
+            chunksize = max(1, min(32, len(tasks) // (workers * 4)))
+            results = pool.imap(_grade_task, tasks, chunksize=chunksize)
+        else:
+            _worker_grader, _worker_details = grader, details
+            results = map(_grade_task, tasks)
+        
+        for record in results:
+            if "error" in record:
+                failed += 1
+                print(f"评价失败: {record['file']}: {record['error']}", file=log)
+            else:
+                success += 1
+            writer.write(record)
+            
+            done = success + failed
+            if done % 100 == 0:
+                elapsed = time.time() - start_time
+                print(f"进度: {done}/{len(tasks)} | 速率: {done / elapsed:.2f} 张/秒", file=log)
+    except BaseException:
+        # 出错或 Ctrl-C 时立即结束工作进程，不再评价队列中剩余的图片
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        raise
+    finally:
+        writer.close()
+        if pool is None:
+            grader.close()
+    
+    if pool is not None:
+        pool.close()
+        pool.join()
+    
+    total_time = time.time() - start_time
+    rate = (success + failed) / total_time if total_time > 0 else 0
+    print(f"评价完成! 成功: {success} | 失败: {failed} | "
+          f"总耗时: {total_time:.1f} 秒 | 平均速率: {rate:.2f} 张/秒", file=log)
+    return success, failed, total_time
+
+def grade_pages(paths, font_style="regular", output=None, workers=4, text=None, method="auto",
+                db_dir="data", grid_size=None, art=True, details=False, top_k=5, roi=None):
+    """
+    逐页评价整页书写，每页切分后的单字在线程池中并行评价
+    :param text: 每页按顺序书写的已知文字
+    :return: (评价的字数, 失败数, 总耗时)
+    """
+    log = sys.stderr
+    print(f"待评价页面: {len(paths)} | 字体: {font_style} | 切分方式: {method} | 线程: {workers}", file=log)
+    grader = CalligraphyGrader(font_style, db_dir, grid_size=grid_size, art=art, top_k=top_k, roi=roi)
+    
+    writer = ResultWriter(output, PAGE_CSV_FIELDS)
+    start_time = time.time()
+    graded = failed = 0
+    try:
+        for path in paths:
+            try:
+                report = grader.grade_page(path, text, method, workers, details)
+            except Exception as e:
+                failed += 1
+                print(f"评价失败: {path}: {str(e)}", file=log)
+                writer.write({"file": path, "error": str(e)})
+                continue
+            summary = report["summary"]
+            graded += summary["graded"]
+            failed += summary["failed"]
+            writer.write_page(report)
+            mean = summary["mean_total_score"]
+            print(f"{path}: {report['method']} 切分 {summary['count']} 字 | "
+                  f"平均得分: {mean if mean is None else round(mean, 3)}", file=log)
+    finally:
+        writer.close()
+        grader.close()
+    
+    total_time = time.time() - start_time
+    rate = graded / total_time if total_time > 0 else 0
+    print(f"评价完成! 评价字数: {graded} | 失败: {failed} | "
+          f"总耗时: {total_time:.1f} 秒 | 平均速率: {rate:.2f} 字/秒", file=log)
+    return graded, failed, total_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='硬笔书法批量评价（无界面）')
+    parser.add_argument('inputs', nargs='+',
+                        help='图片文件、图片目录或 @列表文件（每行一个图片路径）')
+    parser.add_argument('--style', choices=['light', 'medium', 'regular'], default='regular',
+                        help='评价使用的字体标准 (默认: regular)')
+    parser.add_argument('--char', default=None,
+                        help='所有图片共同的已知字符（或十六进制编码），不指定时自动识别')
+    parser.add_argument('--labels', default=None,
+                        help='字符标注文件，每行 "文件名,字符"，优先于 --char')
+    parser.add_argument('--output', '-o', default=None,
+                        help='结果文件，.jsonl 或 .csv (默认: 以 JSONL 输出到标准输出)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='并行工作进程数，整页评价时为每页的线程数 (默认: CPU核心数)')
+    parser.add_argument('--db-dir', default="data",
+                        help='数据库目录 (默认: data)')
+    parser.add_argument('--grid-size', type=int, default=None,
+                        help='结构分析的网格划分数，需与数据库一致 (默认: 从特征存储读取)')
+    parser.add_argument('--no-art', action='store_true',
+                        help='跳过艺术评价')
+    parser.add_argument('--details', action='store_true',
+                        help='JSONL 结果中包含逐项特征对比')
+    parser.add_argument('--top-k', type=int, default=5,
+                        help='自动识别时保留的候选字符数 (默认: 5)')
+    parser.add_argument('--roi', action='store_true', default=None,
+                        help='墨迹区域优先的预处理，需与构建数据库时的 modelapp.py --roi 一致 (默认: 从特征存储读取)')
+    parser.add_argument('--page', action='store_true',
+                        help='输入为整页书写（田字格或自由书写），切分为单字后逐字评价')
+    parser.add_argument('--segment', choices=PageSegmenter.METHODS, default='auto',
+                        help='整页切分方式 (默认: auto，优先检测格线)')
+    parser.add_argument('--text', default=None,
+                        help='配合 --page 使用，每页按顺序书写的已知文字')
+    args = parser.parse_args()
+    
+    paths = collect_images(args.inputs)
+    if not paths:
+        print("错误: 没有找到待评价的图片")
+        sys.exit(1)
+    
+    labels = load_labels(args.labels) if args.labels else None
+    try:
+        if args.page:
+            success, failed, _ = grade_pages(
+                paths, font_style=args.style, output=args.output, workers=args.workers,
+                text=args.text, method=args.segment, db_dir=args.db_dir,
+                grid_size=args.grid_size, art=not args.no_art, details=args.details,
+                top_k=args.top_k, roi=args.roi
+            )
+        else:
+            success, failed, _ = grade_images(
+                paths, font_style=args.style, output=args.output, workers=args.workers,
+                char=args.char, labels=labels, db_dir=args.db_dir, grid_size=args.grid_size,
+                art=not args.no_art, details=args.details, top_k=args.top_k, roi=args.roi
+            )
+    except FileNotFoundError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    sys.exit(0 if success or not failed else 1)
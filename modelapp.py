@@ -1,48 +1,121 @@
 import os
 import json
+import numpy as np
 from tqdm import tqdm
 from core.database import CalligraphyDB
+from core.feature_store import FeatureStore
 from do import ProcessingPipeline
+from builddata import FontImageGenerator
 import argparse
 import time
 import traceback
+from multiprocessing import Pool
 
-def build_database(font_style, base_dir="base", db_dir="data"):
-    """构建特定字体的数据库"""
+# 工作进程内的处理器与字体，由进程池初始化函数在每个进程中创建一次
+_worker_processor = None
+_worker_font = None
+_worker_image_dir = None
+
+def _init_worker(font_path=None, image_dir=None, grid_size=3, roi=False):
+    """
+    进程池初始化：为当前工作进程创建独立的处理器
+    :param font_path: 直接从字体渲染时使用的字体文件
+    :param image_dir: 渲染时同时保存PNG的目录（None 表示不保存）
+    :param grid_size: 结构分析的网格划分数
+    :param roi: 是否使用墨迹区域优先的预处理
+    """
+    global _worker_processor, _worker_font, _worker_image_dir
+    # 构建时每个字形只处理一次，缓存没有命中的机会；多个进程写同一个缓存文件还会争用写锁
+    _worker_processor = ProcessingPipeline(cache_dir=None, grid_size=grid_size, roi=roi)
+    if font_path:
+        _worker_font = FontImageGenerator.load_font(font_path)
+    _worker_image_dir = image_dir
+
+def _extract_features(char_code, char, process):
+    """执行特征提取，返回特征或错误信息（在工作进程中运行）"""
+    start = time.time()
+    try:
+        result = process()
+        return char_code, char, result["features"], None, os.getpid(), time.time() - start
+    except Exception as e:
+        error_msg = f"处理字符 {char} (编码: {char_code}) 失败: {str(e)}"
+        return char_code, char, None, (error_msg, traceback.format_exc()), os.getpid(), time.time() - start
+
+def _process_char(task):
+    """读取字符图片并提取特征"""
+    char_code, char, char_path = task
+    return _extract_features(char_code, char, lambda: _worker_processor.process_image(char_path))
+
+def _render_char(task):
+    """在内存中渲染字符并提取特征，不经过PNG文件"""
+    char_code, char = task
+    
+    def process():
+        img = FontImageGenerator.render_char(_worker_font, char)
+        if _worker_image_dir:
+            img.save(os.path.join(_worker_image_dir, f"{char_code}.png"))
+        return _worker_processor.process_array(np.array(img))
+    
+    return _extract_features(char_code, char, process)
+
+def build_database(font_style, base_dir="base", db_dir="data", workers=1, batch_size=500,
+                   from_fonts=False, font_dir="fonts", save_images=False, grid_size=3, roi=False):
+    """
+    构建特定字体的数据库
+    :param from_fonts: 直接从字体文件渲染字形并在内存中提取特征，不读取 base 下的图片
+    :param save_images: 直接渲染时是否同时把字形图片保存到 base/<style>/
+    :param grid_size: 结构分析的网格划分数（评价时须使用相同设置）
+    :param roi: 墨迹区域优先的预处理（与网格数一起记录在特征存储中，评价时按记录设置）
+    """
     # 创建数据库路径
     os.makedirs(db_dir, exist_ok=True)
     db_path = os.path.join(db_dir, f"calligraphy_{font_style}.db")
     
-    # 初始化数据库和处理器
-    db = CalligraphyDB(db_path)
-    processor = ProcessingPipeline()
-    
-    # 加载全局字符映射
-    char_map_path = os.path.join(base_dir, "char_map.json")
-    if not os.path.exists(char_map_path):
-        print(f"错误: 找不到字符映射文件 {char_map_path}")
-        print("请先运行 builddata.py 生成标准字体图片")
-        return
-    
-    with open(char_map_path, "r", encoding="utf-8") as f:
-        total_map = json.load(f)
-        global_map = total_map["global_map"]  # 获取全局映射
-    
-    # 获取特定字体的映射
-    style_maps = total_map.get("style_maps", {})
-    # 检查请求的字体样式是否存在
-    if font_style not in style_maps:
-        print(f"错误: 找不到字体样式 {font_style} 的映射")
-        return
-    
-    # 创建新的字符列表 - 使用字符编码作为键
-    char_list = {}
-    for char, filename in style_maps[font_style].items():
-        char_code = filename.split('.')[0]  # 从文件名提取编码
-        char_list[char_code] = char  # 存储为 编码 -> 字符
+    # 初始化数据库（只由主进程写入，构建期间使用 WAL 以减少同步刷盘）
+    db = CalligraphyDB(db_path, journal_mode="WAL", synchronous="NORMAL")
     
     char_dir = os.path.join(base_dir, font_style)
     
+    if from_fonts:
+        # 直接使用字体文件和GB2312字符集
+        font_path = os.path.join(font_dir, FontImageGenerator.font_files[font_style])
+        if not os.path.exists(font_path):
+            print(f"错误: 找不到字体文件 {font_path}")
+            print("请将字体文件放在 'fonts' 目录下")
+            return
+        
+        char_list = {}
+        for char in FontImageGenerator.load_common_chars():
+            char_code = hex(ord(char))[2:].upper().zfill(4)
+            char_list[char_code] = char
+        
+        if save_images:
+            os.makedirs(char_dir, exist_ok=True)
+    else:
+        # 加载全局字符映射
+        char_map_path = os.path.join(base_dir, "char_map.json")
+        if not os.path.exists(char_map_path):
+            print(f"错误: 找不到字符映射文件 {char_map_path}")
+            print("请先运行 builddata.py 生成标准字体图片")
+            return
+        
+        with open(char_map_path, "r", encoding="utf-8") as f:
+            total_map = json.load(f)
+            global_map = total_map["global_map"]  # 获取全局映射
+        
+        # 获取特定字体的映射
+        style_maps = total_map.get("style_maps", {})
+        # 检查请求的字体样式是否存在
+        if font_style not in style_maps:
+            print(f"错误: 找不到字体样式 {font_style} 的映射")
+            return
+        
+        # 创建新的字符列表 - 使用字符编码作为键
+        char_list = {}
+        for char, filename in style_maps[font_style].items():
+            char_code = filename.split('.')[0]  # 从文件名提取编码
+            char_list[char_code] = char  # 存储为 编码 -> 字符
+    
     print(f"开始构建数据库: {font_style} 字体")
     print(f"共有 {len(char_list)} 个字符需要处理")
     
@@ -59,10 +132,16 @@ def build_database(font_style, base_dir="base", db_dir="data"):
     start_time = time.time()
     error_log = []
     
-    for char_code, char in tqdm(char_list.items(), desc=f"处理 {font_style} 字体"):
+    # 收集待处理的字符
+    tasks = []
+    for char_code, char in char_list.items():
         # 如果已经处理过，则跳过
         if char_code in processed_chars:
             continue
+        
+        if from_fonts:
+            tasks.append((char_code, char))
+            continue
             
         # 构建图片路径 - 使用编码作为文件名
         char_path = os.path.join(char_dir, f"{char_code}.png")
@@ -74,33 +153,86 @@ def build_database(font_style, base_dir="base", db_dir="data"):
             error_log.append(error_msg)
             continue
         
-        try:
-            # 处理图像并提取特征
-            result = processor.process_image(char_path)
-            
-            # 插入数据库 - 使用char_code作为键
-            db.insert_standard_char(char_code, char, font_style, result["features"])
-            
-            # 记录已处理
-            processed_count += 1
-            processed_chars.add(char_code)  # 使用char_code作为断点记录
-            with open(checkpoint_file, "a", encoding="utf-8") as f:
-                f.write(f"{char_code}\n")
-            
-            # 每处理100个字符显示一次进度
-            if processed_count % 100 == 0:
-                elapsed = time.time() - start_time
-                rate = processed_count / elapsed if elapsed > 0 else 0
-                remaining = (len(char_list) - len(processed_chars)) / rate if rate > 0 else float('inf')
-                print(f"进度: {processed_count}/{len(char_list)} | "
-                      f"速率: {rate:.2f} 字符/秒 | "
-                      f"预计剩余时间: {remaining/60:.1f} 分钟")
+        tasks.append((char_code, char, char_path))
+    
+    # 多进程模式：工作进程提取特征，主进程作为唯一的写入者
+    if from_fonts:
+        worker_func = _render_char
+        init_args = (font_path, char_dir if save_images else None, grid_size, roi)
+    else:
+        worker_func = _process_char
+        init_args = (None, None, grid_size, roi)
+    
+    pool = None
+    if workers > 1:
+        print(f"使用 {workers} 个工作进程并行处理")
+        pool = Pool(processes=workers, initializer=_init_worker, initargs=init_args)
+        chunksize = max(1, min(32, len(tasks) // (workers * 4)))
+        results = pool.imap_unordered(worker_func, tasks, chunksize=chunksize)
+    else:
+        _init_worker(*init_args)
+        results = map(worker_func, tasks)
+    
+    # 各工作进程的统计: pid -> [处理数量, 累计耗时]
+    worker_stats = {}
+    
+    # 待写入的字符，攒满一批后在单个事务中写入
+    pending = []
+    
+    def flush_pending(checkpoint):
+        """写入一批字符，提交成功后再记录断点"""
+        if not pending:
+            return
+        db.insert_standard_chars(pending, batch_size=batch_size)
+        checkpoint.write("".join(f"{row[0]}\n" for row in pending))
+        checkpoint.flush()
+        pending.clear()
+    
+    try:
+        with open(checkpoint_file, "a", encoding="utf-8") as checkpoint:
+            for char_code, char, features, error, pid, char_time in tqdm(
+                    results, total=len(tasks), desc=f"处理 {font_style} 字体"):
+                stats = worker_stats.setdefault(pid, [0, 0.0])
+                stats[0] += 1
+                stats[1] += char_time
                 
-        except Exception as e:
-            error_msg = f"处理字符 {char} (编码: {char_code}) 失败: {str(e)}"
-            error_log.append(error_msg)
-            print(error_msg)
-            traceback.print_exc()
+                if error is not None:
+                    error_msg, error_trace = error
+                    error_log.append(error_msg)
+                    print(error_msg)
+                    print(error_trace)
+                    continue
+                
+                # 加入待写入批次 - 使用char_code作为键
+                pending.append((char_code, char, font_style, features))
+                if len(pending) >= batch_size:
+                    flush_pending(checkpoint)
+                
+                # 记录已处理
+                processed_count += 1
+                processed_chars.add(char_code)  # 使用char_code作为断点记录
+                
+                # 每处理100个字符显示一次进度
+                if processed_count % 100 == 0:
+                    elapsed = time.time() - start_time
+                    rate = processed_count / elapsed if elapsed > 0 else 0
+                    remaining = (len(char_list) - len(processed_chars)) / rate if rate > 0 else float('inf')
+                    print(f"进度: {processed_count}/{len(char_list)} | "
+                          f"速率: {rate:.2f} 字符/秒 | "
+                          f"预计剩余时间: {remaining/60:.1f} 分钟")
+            
+            # 写入最后一批
+            flush_pending(checkpoint)
+    except BaseException:
+        # 出错或 Ctrl-C 时立即结束工作进程，不等待队列中剩余的字符（已提交的批次记录在断点中）
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        raise
+    
+    if pool is not None:
+        pool.close()
+        pool.join()
     
     # 保存错误日志
     error_log_path = f"error_log_{font_style}.txt"
@@ -120,10 +252,35 @@ def build_database(font_style, base_dir="base", db_dir="data"):
         os.remove(checkpoint_file)
     
     total_time = time.time() - start_time
+    
+    # 打印每个工作进程的吞吐量
+    if workers > 1:
+        print("各工作进程吞吐量:")
+        for index, (pid, (count, busy)) in enumerate(sorted(worker_stats.items()), 1):
+            rate = count / busy if busy > 0 else 0
+            print(f"  进程 {index} (pid {pid}): {count} 字符 | 速率: {rate:.2f} 字符/秒")
+    
     print(f"数据库文件位置: {db_path}")
     print(f"总耗时: {total_time/60:.1f} 分钟 | 平均速率: {len(char_list)/total_time:.2f} 字符/秒")
+    
+    # 导出列式特征存储供评价时直接加载，同时记录预处理参数，评价时据此设置或拒绝不一致的参数
+    preprocess = ProcessingPipeline(cache_dir=None, grid_size=grid_size, roi=roi).config()
+    export_feature_store(db, font_style, preprocess)
     db.close()
 
+def export_feature_store(db, font_style, preprocess=None):
+    """
+    从数据库导出特征存储
+    :param preprocess: 构建时的预处理参数，None 时沿用已有特征存储中的记录（只重新导出时）
+    """
+    if preprocess is None and FeatureStore.exists(db.db_path):
+        preprocess = FeatureStore.load(db.db_path).preprocess
+    store = FeatureStore.export(db, font_style, preprocess)
+    matrix_path, _ = FeatureStore.paths_for(db.db_path)
+    print(f"特征存储已导出: {matrix_path} ({len(store)} 个字符, {store.matrix.shape[1]} 列)")
+    if preprocess is None:
+        print("警告: 未记录构建时的预处理参数，评价时无法检查 --roi 等设置是否一致，建议重新构建数据库")
+
 if __name__ == "__main__":
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='构建标准字符数据库')
@@ -131,16 +288,48 @@ if __name__ == "__main__":
                         help='要构建的字体样式 (默认: regular)')
     parser.add_argument('--all', action='store_true',
                         help='构建所有字体样式')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行处理的工作进程数 (默认: 1, 单进程)')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='每个数据库事务写入的字符数 (默认: 500)')
+    parser.add_argument('--from-fonts', action='store_true',
+                        help='直接从字体文件渲染字形并在内存中提取特征，无需先运行 builddata.py')
+    parser.add_argument('--font-dir', default="fonts",
+                        help='字体文件目录 (配合 --from-fonts 使用)')
+    parser.add_argument('--save-images', action='store_true',
+                        help='配合 --from-fonts 使用，同时保存字形图片到 base 目录')
+    parser.add_argument('--grid-size', type=int, default=3,
+                        help='结构分析的网格划分数 N (N x N, 默认: 3 即九宫格)')
+    parser.add_argument('--roi', action='store_true',
+                        help='墨迹区域优先的预处理：裁剪到墨迹范围并保持长宽比归一化（记录在特征存储中，评价时自动使用）')
+    parser.add_argument('--export-only', action='store_true',
+                        help='不重新构建，只从已有数据库导出特征存储')
     args = parser.parse_args()
     
     # 创建数据目录
     os.makedirs("data", exist_ok=True)
     
-    if args.all:
+    if args.export_only:
+        styles = ["light", "medium", "regular"] if args.all else [args.style]
+        for style in styles:
+            db_path = os.path.join("data", f"calligraphy_{style}.db")
+            if not os.path.exists(db_path):
+                print(f"错误: 数据库文件不存在: {db_path}")
+                continue
+            db = CalligraphyDB(db_path)
+            export_feature_store(db, style)
+            db.close()
+    elif args.all:
         styles = ["light", "medium", "regular"]
         print(f"将构建所有字体样式: {', '.join(styles)}")
         for style in styles:
-            build_database(style)
+            build_database(style, workers=args.workers, batch_size=args.batch_size,
+                           from_fonts=args.from_fonts, font_dir=args.font_dir,
+                           save_images=args.save_images, grid_size=args.grid_size,
+                           roi=args.roi)
     else:
         print(f"将构建字体样式: {args.style}")
-        build_database(args.style)
\ No newline at end of file
+        build_database(args.style, workers=args.workers, batch_size=args.batch_size,
+                       from_fonts=args.from_fonts, font_dir=args.font_dir,
+                       save_images=args.save_images, grid_size=args.grid_size,
+                       roi=args.roi)
\ No newline at end of file
@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from grade import CalligraphyGrader, to_char_code
+from utils.segmenter import PageSegmenter
+
+STYLES = ["light", "medium", "regular"]
+
+class ServiceBusy(Exception):
+    """等待队列已满，拒绝新请求（HTTP 503）"""
+    pass
+
+class RequestError(Exception):
+    """请求参数错误"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def check_image(data):
+    """检查请求中是否有图片数据（解码在评价线程中进行）"""
+    if not data:
+        raise RequestError("缺少图像数据")
+    return data
+
+def decode_image(preprocessor, data, max_side=None):
+    """从图片字节解码灰度图（按 EXIF 方向旋转，max_side 为结果最长边上限）"""
+    try:
+        return preprocessor.decode(data, max_side)
+    except ValueError:
+        raise RequestError("无法解码图像")
+
+def grade_image_data(grader, data, char_code=None, details=False):
+    """评价线程：解码并评价单张图片（与 grade.py 一样在解码时缩小到工作分辨率）"""
+    preprocessor = grader.pipeline.preprocessor
+    gray = decode_image(preprocessor, data, preprocessor.decode_side())
+    return grader.grade_array(gray, char_code, details)
+
+def grade_page_data(grader, data, text=None, method="auto", workers=2, details=False, executor=None):
+    """评价线程：按原分辨率解码整页并评价"""
+    gray = decode_image(grader.pipeline.preprocessor, data)
+    return grader.grade_page_array(gray, text, method, workers, details, executor)
+
+class GradingService:
+    """
+    评价服务：启动时为每种字体预先加载评价器与特征表，
+    评价任务在有界线程池中执行，超出等待队列的请求直接拒绝
+    """
+    def __init__(self, styles=None, db_dir="data", workers=None, max_pending=None, timeout=30.0,
+                 art=True, page_workers=2):
+        """
+        :param styles: 预加载的字体样式，默认加载数据库存在的全部样式
+        :param workers: 评价线程数（OpenCV 计算期间释放 GIL），默认CPU核心数
+        :param max_pending: 执行中与排队的评价任务上限，超出返回 503，默认 workers 的4倍
+        :param timeout: 单个请求的最长等待时间（秒），超时返回 504
+        :param page_workers: 整页评价中单字评价的线程数（所有整页请求共用）
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.timeout = timeout
+        self.page_workers = page_workers
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="grader")
+        # 整页的单字在共用的线程池中评价，并发页数再多，单字评价线程也不超过 page_workers
+        self.cell_executor = ThreadPoolExecutor(max_workers=max(1, page_workers), thread_name_prefix="page-cell")
+        
+        self.graders = {}
+        for style in styles or STYLES:
+            if not styles and not os.path.exists(os.path.join(db_dir, f"calligraphy_{style}.db")):
+                continue
+            grader = CalligraphyGrader(style, db_dir, art=art)
+            if grader.evaluator.feature_store is not None:
+                grader.get_recognizer()  # 预先创建识别器，避免首个请求等待
+            self.graders[style] = grader
+        if not self.graders:
+            raise FileNotFoundError(f"{db_dir} 下没有可用的字体数据库，请先运行 modelapp.py 构建数据库")
+        
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.start_time = time.time()
+        self.stats = {}  # 接口 -> 请求数、状态码与耗时统计
+        self.images_graded = 0
+    
+    def get_grader(self, style):
+        """获取已加载的字体评价器"""
+        grader = self.graders.get(style or "regular")
+        if grader is None:
+            raise RequestError(f"字体样式未加载: {style}，可用: {', '.join(self.graders)}")
+        return grader
+    
+    def run(self, calls):
+        """
+        在线程池中执行一组评价任务并等待结果
+        :param calls: [(函数, 参数元组), ...]
+        :raises ServiceBusy: 等待队列容纳不下这组任务
+        :raises TimeoutError: 超过请求超时时间（任务仍会执行完，其间继续占用队列）
+        """
+        with self._lock:
+            if self.pending + len(calls) > self.max_pending:
+                raise ServiceBusy(f"服务繁忙: {self.pending} 个任务进行中")
+            self.pending += len(calls)
+        
+        futures = []
+        for fn, args in calls:
+            future = self.executor.submit(fn, *args)
+            future.add_done_callback(self._task_done)
+            futures.append(future)
+        
+        deadline = time.time() + self.timeout
+        try:
+            return [future.result(timeout=max(0, deadline - time.time())) for future in futures]
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()  # 尚未开始的任务不再执行
+            raise TimeoutError(f"评价超时 ({self.timeout} 秒)")
+    
+    def _task_done(self, future):
+        with self._lock:
+            self.pending -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.images_graded += 1
+    
+    def grade(self, data, style=None, char=None, details=False):
+        """评价单张图片（先占用队列再解码，服务繁忙时不解码直接拒绝）"""
+        grader = self.get_grader(style)
+        code = to_char_code(char) if char else None
+        return self.run([(grade_image_data, (grader, check_image(data), code, details))])[0]
+    
+    def grade_batch(self, items, style=None, details=False):
+        """
+        评价多张图片
+        :param items: [(图片字节, 字符或None), ...]
+        """
+        grader = self.get_grader(style)
+        calls = []
+        for data, char in items:
+            code = to_char_code(char) if char else None
+            calls.append((grade_image_data, (grader, check_image(data), code, details)))
+        if not calls:
+            raise RequestError("缺少图像数据")
+        return self.run(calls)
+    
+    def grade_page(self, data, style=None, text=None, method="auto", details=False):
+        """评价整页书写，整页作为一个任务，页内单字提交到共用的单字线程池并行评价"""
+        grader = self.get_grader(style)
+        if method not in PageSegmenter.METHODS:
+            raise RequestError(f"不支持的切分方式: {method}")
+        return self.run([(grade_page_data, (grader, check_image(data), text, method,
+                                            self.page_workers, details, self.cell_executor))])[0]
+    
+    def record(self, endpoint, status, elapsed):
+        """记录请求统计"""
+        with self._lock:
+            stats = self.stats.setdefault(endpoint, {
+                "requests": 0, "status": {}, "total_seconds": 0.0, "max_seconds": 0.0
+            })
+            stats["requests"] += 1
+            stats["status"][str(status)] = stats["status"].get(str(status), 0) + 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+    
+    def health(self):
+        return {"status": "ok", "styles": list(self.graders)}
+    
+    def metrics(self):
+        """运行指标：队列占用、已评价图片数与各接口的请求统计"""
+        with self._lock:
+            endpoints = {
+                endpoint: {
+                    **stats,
+                    "status": dict(stats["status"]),
+                    "mean_seconds": stats["total_seconds"] / stats["requests"]
+                }
+                for endpoint, stats in self.stats.items()
+            }
+            uptime = time.time() - self.start_time
+            return {
+                "uptime_seconds": uptime,
+                "workers": self.workers,
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "timeout_seconds": self.timeout,
+                "images_graded": self.images_graded,
+                "images_per_second": self.images_graded / uptime if uptime > 0 else 0,
+                "endpoints": endpoints
+            }
+    
+    def close(self):
+        """等待进行中的任务结束并关闭数据库连接"""
+        self.executor.shutdown(wait=True)
+        self.cell_executor.shutdown(wait=True)
+        for grader in self.graders.values():
+            grader.close()
+
+class GradingRequestHandler(BaseHTTPRequestHandler):
+    """
+    接口：
+    GET  /health       服务状态
+    GET  /metrics      运行指标
+    POST /grade        单张图片（请求体为图片字节，参数 style/char 放在查询串；或 JSON: image 为 base64）
+    POST /grade/batch  JSON: {"style", "items": [{"image": base64, "char"}, ...]}
+    POST /grade/page   整页图片（查询串或 JSON 参数 style/text/method）
+    """
+    server_version = "InkSight"
+    
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self.send_json(200, self.server.service.health())
+        elif path == "/metrics":
+            self.send_json(200, self.server.service.metrics())
+        else:
+            self.send_json(404, {"error": f"未知接口: {path}"})
+    
+    def do_POST(self):
+        path = urlparse(self.path).path
+        service = self.server.service
+        start = time.time()
+        try:
+            params = self.read_params()
+            style = self.text_param(params, "style")
+            details = str(params.get("details", "")).lower() in ("1", "true")
+            if path == "/grade":
+                result = service.grade(self.image_bytes(params), style, self.text_param(params, "char"), details)
+            elif path == "/grade/batch":
+                items = params.get("items")
+                if not isinstance(items, list):
+                    raise RequestError("批量评价需要 JSON 请求体: {\"items\": [...]}")
+                if not all(isinstance(item, dict) for item in items):
+                    raise RequestError("items 中的每一项须为 JSON 对象: {\"image\", \"char\"}")
+                result = {"results": service.grade_batch(
+                    [(self.image_bytes(item), self.text_param(item, "char")) for item in items], style, details
+                )}
+            elif path == "/grade/page":
+                result = service.grade_page(self.image_bytes(params), style, self.text_param(params, "text"),
+                                            self.text_param(params, "method") or "auto", details)
+            else:
+                raise RequestError(f"未知接口: {path}", 404)
+            status = 200
+        except RequestError as e:
+            status, result = e.status, {"error": str(e)}
+        except ServiceBusy as e:
+            status, result = 503, {"error": str(e)}
+        except TimeoutError as e:
+            status, result = 504, {"error": str(e)}
+        except Exception as e:
+            status, result = 500, {"error": f"评价失败: {str(e)}"}
+        
+        service.record(path, status, time.time() - start)
+        headers = {"Retry-After": "1"} if status == 503 else None
+        self.send_json(status, result, headers)
+    
+    def read_params(self):
+        """读取请求参数：JSON 请求体，或图片字节 + 查询串参数"""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.server.max_body:
+            raise RequestError(f"请求体过大: {length} 字节", 413)
+        body = self.rfile.read(length)
+        
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                payload = json.loads(body.decode("utf-8"))
+            except (ValueError, UnicodeDecodeError):
+                raise RequestError("JSON 格式错误")
+            if not isinstance(payload, dict):
+                raise RequestError("JSON 请求体须为对象")
+            params.update(payload)
+        else:
+            params["body"] = body
+        return params
+    
+    def image_bytes(self, params):
+        """请求中的图片字节（原始请求体或 base64 字段）"""
+        if "body" in params:
+            return params["body"]
+        if not isinstance(params.get("image") or "", str):
+            raise RequestError("image 字段须为 base64 字符串")
+        try:
+            return base64.b64decode(params.get("image") or "")
+        except ValueError:
+            raise RequestError("image 字段不是有效的 base64")
+    
+    def text_param(self, params, key):
+        """读取字符串参数（未提供时为 None），JSON 中类型不对时返回 400"""
+        value = params.get(key)
+        if value is not None and not isinstance(value, str):
+            raise RequestError(f"{key} 字段须为字符串")
+        return value
+    
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+def create_server(service, host="127.0.0.1", port=8000, max_body=20 * 1024 * 1024, quiet=False):
+    """创建 HTTP 服务（port 为 0 时自动分配端口）"""
+    server = ThreadingHTTPServer((host, port), GradingRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.max_body = max_body
+    server.quiet = quiet
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='硬笔书法评价 HTTP 服务')
+    parser.add_argument('--host', default="127.0.0.1",
+                        help='监听地址 (默认: 127.0.0.1，仅本机访问)')
+    parser.add_argument('--port', type=int, default=8000,
+                        help='监听端口 (默认: 8000)')
+    parser.add_argument('--styles', nargs='+', choices=STYLES, default=None,
+                        help='预加载的字体样式 (默认: data 下已构建的全部样式)')
+    parser.add_argument('--db-dir', default="data",
+                        help='数据库目录 (默认: data)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='评价线程数 (默认: CPU核心数)')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='执行中与排队任务上限，超出返回 503 (默认: 线程数的4倍)')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='单个请求的超时时间，秒 (默认: 30)')
+    parser.add_argument('--page-workers', type=int, default=2,
+                        help='整页评价中单字评价的线程数，所有整页请求共用 (默认: 2)')
+    parser.add_argument('--no-art', action='store_true',
+                        help='跳过艺术评价')
+    parser.add_argument('--quiet', action='store_true',
+                        help='不打印每个请求的访问日志')
+    args = parser.parse_args()
+    
+    try:
+        service = GradingService(args.styles, args.db_dir, args.workers, args.max_pending,
+                                 args.timeout, art=not args.no_art, page_workers=args.page_workers)
+    except FileNotFoundError as e:
+        print(f"错误: {e}")
+        raise SystemExit(1)
+    
+    server = create_server(service, args.host, args.port, quiet=args.quiet)
+    print(f"评价服务已启动: http://{args.host}:{server.server_port} | "
+          f"字体: {', '.join(service.graders)} | 线程: {service.workers}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("正在停止服务...")
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from core.art import ArtEvaluator
+
+def reference_gradient_coherence(grad_mag):
+    """原先逐像素循环的实现，作为向量化版本的对照"""
+    rows, cols = grad_mag.shape
+    coherence = 0
+    count = 0
+    
+    if rows < 3 or cols < 3:
+        return 0.0
+    
+    for i in range(1, rows-1):
+        for j in range(1, cols-1):
+            if grad_mag[i, j] > 0.3:
+                local_grad = grad_mag[i-1:i+2, j-1:j+2]
+                if np.std(local_grad) < 0.2:
+                    coherence += 1
+                count += 1
+    
+    return coherence / count if count > 0 else 0
+
+class GradientCoherenceTest(unittest.TestCase):
+    """calculate_gradient_coherence 与原先循环实现的一致性"""
+    
+    def setUp(self):
+        self.evaluator = ArtEvaluator()
+        rng = np.random.default_rng(0)
+        yy, xx = np.mgrid[0:64, 0:80]
+        self.fields = {
+            "noise": rng.random((48, 48)),
+            "smooth": 0.5 + 0.5 * np.sin(xx / 7.0) * np.cos(yy / 5.0),
+            "binary": (rng.random((40, 56)) > 0.6).astype(np.float64),
+            "ramp": np.tile(np.linspace(0, 1, 80), (64, 1)),
+            "float32": rng.random((30, 30)).astype(np.float32),
+            "flat_zero": np.zeros((32, 32)),
+            "flat_strong": np.full((32, 32), 0.8),
+            "tiny": rng.random((2, 5)),
+            "empty": np.zeros((0, 0))
+        }
+    
+    def test_matches_reference_loop(self):
+        for name, field in self.fields.items():
+            with self.subTest(field=name):
+                expected = reference_gradient_coherence(field)
+                actual = self.evaluator.calculate_gradient_coherence(field)
+                self.assertTrue(np.allclose(actual, expected), f"{name}: {actual} != {expected}")
+    
+    def test_flat_and_empty_inputs(self):
+        self.assertEqual(self.evaluator.calculate_gradient_coherence(self.fields["flat_zero"]), 0)
+        self.assertEqual(self.evaluator.calculate_gradient_coherence(self.fields["flat_strong"]), 1.0)
+        self.assertEqual(self.evaluator.calculate_gradient_coherence(self.fields["empty"]), 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import cv2
+import numpy as np
+from utils.segmenter import PageSegmenter
+from utils.preprocessor import ImagePreprocessor
+
+def grid_page(rows=3, cols=4, cell=140, midlines=True, strokes=None):
+    """合成田字格整页：实线方格，可选虚线中线；strokes(r, c, x, y) 在每个格子中画笔画"""
+    margin = 20
+    page = np.full((rows * cell + 2 * margin, cols * cell + 2 * margin), 235, np.uint8)
+    for i in range(rows + 1):
+        cv2.line(page, (margin, margin + i * cell), (margin + cols * cell, margin + i * cell), 60, 3)
+    for j in range(cols + 1):
+        cv2.line(page, (margin + j * cell, margin), (margin + j * cell, margin + rows * cell), 60, 3)
+    if midlines:
+        for i in range(rows):
+            y = margin + i * cell + cell // 2
+            for x in range(margin, margin + cols * cell, 10):
+                cv2.line(page, (x, y), (x + 5, y), 100, 2)
+        for j in range(cols):
+            x = margin + j * cell + cell // 2
+            for y in range(margin, margin + rows * cell, 10):
+                cv2.line(page, (x, y), (x, y + 5), 100, 2)
+    for r in range(rows):
+        for c in range(cols):
+            (strokes or default_strokes)(page, r, c, margin + c * cell, margin + r * cell, cell)
+    return page
+
+def default_strokes(page, r, c, x, y, cell):
+    """不与中线相交的笔画：左上的“口”和右下的斜画"""
+    cv2.rectangle(page, (x + cell // 6 + 3 * c, y + cell // 6 + 3 * r), (x + 2 * cell // 5, y + 2 * cell // 5), 20, 6)
+    cv2.line(page, (x + 3 * cell // 5, y + 3 * cell // 5), (x + 5 * cell // 6 - 3 * c, y + 5 * cell // 6 - 3 * r), 20, 6)
+
+def cross_strokes(page, r, c, x, y, cell):
+    """压在中线上的“十”字"""
+    cv2.line(page, (x + cell // 4, y + cell // 2), (x + 3 * cell // 4, y + cell // 2), 20, 8)
+    cv2.line(page, (x + cell // 2, y + cell // 4), (x + cell // 2, y + 3 * cell // 4), 20, 8)
+
+class GridMidlineTest(unittest.TestCase):
+    """田字格虚线中线在切分时擦除，不进入单字预处理结果"""
+    
+    def setUp(self):
+        self.segmenter = PageSegmenter("grid")
+        self.preprocessor = ImagePreprocessor()
+    
+    def preprocessed_cells(self, page):
+        method, cells = self.segmenter.segment(page)
+        self.assertEqual(method, "grid")
+        return [self.preprocessor.preprocess(cell["image"]) > 0 for cell in cells]
+    
+    def assert_matches_clean(self, strokes):
+        dashed = self.preprocessed_cells(grid_page(midlines=True, strokes=strokes))
+        clean = self.preprocessed_cells(grid_page(midlines=False, strokes=strokes))
+        self.assertEqual(len(dashed), 12)
+        self.assertEqual(len(clean), 12)
+        for i, (a, b) in enumerate(zip(dashed, clean)):
+            with self.subTest(cell=i):
+                extra = np.count_nonzero(a & ~b) / np.count_nonzero(b)
+                lost = np.count_nonzero(b & ~a) / np.count_nonzero(b)
+                self.assertLess(extra, 0.05)
+                self.assertLess(lost, 0.05)
+    
+    def test_dashed_midlines_erased(self):
+        self.assert_matches_clean(default_strokes)
+        # 中线所在的行/列不再有贯穿格子的墨迹
+        for i, cell in enumerate(self.preprocessed_cells(grid_page(strokes=default_strokes))):
+            with self.subTest(cell=i):
+                self.assertLess(cell[60:68].any(axis=0).mean(), 0.1)
+                self.assertLess(cell[:, 60:68].any(axis=1).mean(), 0.1)
+    
+    def test_strokes_on_midlines_kept(self):
+        self.assert_matches_clean(cross_strokes)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import numpy as np
+
+class FeatureCache:
+    """
+    单文件特征缓存（SQLite）
+    以 (图像内容哈希, 预处理配置) 为键保存特征JSON与可选的压缩预处理图，
+    超出条数或容量上限时按最近使用时间淘汰
+    """
+    def __init__(self, path="cache/features.db", max_entries=50000, max_bytes=256 * 1024 * 1024,
+                 store_bitmap=True, evict_interval=100):
+        """
+        :param max_entries: 最多保存的条目数
+        :param max_bytes: 特征与图像数据的总字节上限
+        :param store_bitmap: 是否保存压缩后的预处理图（命中时无需重新预处理）
+        :param evict_interval: 每写入多少条检查一次是否需要淘汰；命中记录的最近使用时间也按此条数批量写回
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store_bitmap = store_bitmap
+        self.evict_interval = evict_interval
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._touched = {}  # (digest, config) -> 最近命中时间，批量写回，命中时不开写事务
+        self.hits = 0
+        self.misses = 0
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.conn:
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS feature_cache (
+                digest TEXT,
+                config TEXT,
+                features TEXT,
+                bitmap BLOB,
+                shape TEXT,
+                size INTEGER,
+                last_used REAL,
+                PRIMARY KEY (digest, config)
+            )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_feature_cache_last_used ON feature_cache (last_used)")
+            # 文件属性键 -> 内容哈希，文件未变化时无需读取文件计算哈希
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_aliases (
+                alias TEXT PRIMARY KEY,
+                digest TEXT
+            )
+            """)
+    
+    @property
+    def conn(self):
+        """当前线程的连接（WAL 模式，多线程/多进程共用一个缓存文件）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def get(self, digest, config):
+        """
+        读取缓存
+        :return: (features, 预处理图或None)，未命中返回 None
+        """
+        row = self.conn.execute("""
+        SELECT features, bitmap, shape FROM feature_cache WHERE digest=? AND config=?
+        """, (digest, config)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        with self._lock:
+            self._touched[(digest, config)] = time.time()
+            flush = len(self._touched) >= self.evict_interval
+        if flush:
+            self.flush()
+        features, bitmap, shape = row
+        image = None
+        if bitmap is not None:
+            image = np.frombuffer(zlib.decompress(bitmap), dtype=np.uint8).reshape(json.loads(shape))
+        return json.loads(features), image
+    
+    def get_alias(self, alias):
+        """文件属性键对应的内容哈希，未记录时返回 None"""
+        row = self.conn.execute("SELECT digest FROM cache_aliases WHERE alias=?", (alias,)).fetchone()
+        return row[0] if row else None
+    
+    def put_alias(self, alias, digest):
+        """记录文件属性键对应的内容哈希"""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO cache_aliases (alias, digest) VALUES (?, ?)",
+                              (alias, digest))
+    
+    def put(self, digest, config, features, image=None):
+        """写入缓存，image 为预处理后的 uint8 图像"""
+        features_json = json.dumps(features)
+        bitmap = shape = None
+        if self.store_bitmap and image is not None:
+            bitmap = zlib.compress(np.ascontiguousarray(image, dtype=np.uint8).tobytes())
+            shape = json.dumps(list(image.shape))
+        size = len(features_json) + (len(bitmap) if bitmap is not None else 0)
+        
+        with self.conn:
+            self.conn.execute("""
+            INSERT OR REPLACE INTO feature_cache
+            (digest, config, features, bitmap, shape, size, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (digest, config, features_json, bitmap, shape, size, time.time()))
+            # 顺带写回缓冲的命中时间，不再单独开事务
+            self._write_touched(self.conn)
+        
+        with self._lock:
+            self._puts += 1
+            check = self._puts % self.evict_interval == 0
+        if check:
+            self.evict()
+    
+    def _write_touched(self, conn):
+        """在当前事务中写回缓冲的命中时间"""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            conn.executemany("UPDATE feature_cache SET last_used=? WHERE digest=? AND config=?",
+                             [(last_used, digest, config) for (digest, config), last_used in touched.items()])
+    
+    def flush(self):
+        """将缓冲的命中时间写回缓存文件"""
+        with self._lock:
+            if not self._touched:
+                return
+        with self.conn:
+            self._write_touched(self.conn)
+    
+    def evict(self):
+        """按最近使用时间淘汰，直到条数与总字节数都不超过上限"""
+        # 先写回命中时间，淘汰顺序才反映最近的使用
+        self.flush()
+        count, total = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM feature_cache"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return 0
+        
+        removed = 0
+        cursor = self.conn.execute("SELECT digest, config, size FROM feature_cache ORDER BY last_used")
+        victims = []
+        for digest, config, size in cursor:
+            if count - removed <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((digest, config))
+            removed += 1
+            total -= size
+        with self.conn:
+            self.conn.executemany("DELETE FROM feature_cache WHERE digest=? AND config=?", victims)
+            # 清理指向已淘汰内容的文件属性键
+            self.conn.execute("""
+            DELETE FROM cache_aliases WHERE digest NOT IN (SELECT digest FROM feature_cache)
+            """)
+        return removed
+    
+    def stats(self):
+        """缓存条数、总字节数与命中统计"""
+        count, total = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM feature_cache"
+        ).fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._touched = {}
+        with self.conn:
+            self.conn.execute("DELETE FROM feature_cache")
+            self.conn.execute("DELETE FROM cache_aliases")
+    
+    def close(self):
+        """写回命中时间并关闭所有线程的连接"""
+        try:
+            self.flush()
+        except sqlite3.Error as e:
+            print(f"写回缓存使用时间失败: {str(e)}")
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
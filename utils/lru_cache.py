@@ -0,0 +1,42 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """线程安全的有界LRU缓存，超出容量时淘汰最久未使用的项"""
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, default=None):
+        """读取缓存项并标记为最近使用"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+    
+    def put(self, key, value):
+        """写入缓存项，必要时淘汰最久未使用的项"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from .lru_cache import LRUCache
+
+def default_token_file(name="baidu_token.json"):
+    """用户缓存目录下的 token 文件路径（不放在项目目录中，避免随代码提交或共享）"""
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "inksight", name)
+
+class OCRError(Exception):
+    """OCR 服务返回错误或无识别结果"""
+    pass
+
+class OCRBackend:
+    """
+    OCR 后端接口
+    子类实现 recognize(image_bytes)，返回按行排列的识别文字列表
+    """
+    name = "base"
+    
+    def recognize(self, image_bytes):
+        raise NotImplementedError
+    
+    def close(self):
+        pass
+
+class BaiduOCRBackend(OCRBackend):
+    """
+    百度通用文字识别
+    access token 缓存到过期前（可选保存到文件，程序重启后继续使用），
+    所有请求复用同一个 keep-alive 会话；token_url/ocr_url 可指向本地的替身服务用于测试与压测
+    """
+    name = "baidu"
+    TOKEN_URL = "https://aip.baidubce.com/oauth/2.0/token"
+    OCR_URL = "https://aip.baidubce.com/rest/2.0/ocr/v1/general_basic"
+    # access token 失效/过期的错误码，刷新后重试一次
+    TOKEN_ERROR_CODES = (110, 111)
+    
+    def __init__(self, api_key, secret_key, token_url=None, ocr_url=None, token_file=None,
+                 timeout=10, refresh_margin=3600, session=None):
+        """
+        :param token_file: token 缓存文件，None 表示只缓存在内存中
+        :param timeout: 单次请求超时（秒）
+        :param refresh_margin: 距过期不足该秒数时提前刷新 token
+        """
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.token_url = token_url or self.TOKEN_URL
+        self.ocr_url = ocr_url or self.OCR_URL
+        self.token_file = token_file
+        self.timeout = timeout
+        self.refresh_margin = refresh_margin
+        
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        self.token_requests = 0
+        self._load_token()
+    
+    def _key_id(self):
+        """token 缓存对应的密钥标识，更换密钥后旧 token 失效"""
+        return hashlib.blake2b(f"{self.api_key}:{self.token_url}".encode(), digest_size=8).hexdigest()
+    
+    def _load_token(self):
+        """从缓存文件读取未过期的 token"""
+        if not self.token_file or not os.path.exists(self.token_file):
+            return
+        try:
+            with open(self.token_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("key_id") == self._key_id():
+                self._token = data["access_token"]
+                self._expires_at = data["expires_at"]
+        except (ValueError, KeyError, OSError):
+            pass
+    
+    def _save_token(self):
+        if not self.token_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.token_file)), exist_ok=True)
+            # 仅当前用户可读写
+            fd = os.open(self.token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"key_id": self._key_id(), "access_token": self._token,
+                           "expires_at": self._expires_at}, f)
+        except OSError as e:
+            print(f"保存OCR token失败: {str(e)}")
+    
+    def get_token(self, refresh=False):
+        """获取 access token，缓存有效期内不重复请求"""
+        with self._lock:
+            if not refresh and self._token and time.time() < self._expires_at - self.refresh_margin:
+                return self._token
+            
+            response = self.session.get(self.token_url, params={
+                "grant_type": "client_credentials",
+                "client_id": self.api_key,
+                "client_secret": self.secret_key
+            }, timeout=self.timeout)
+            response.raise_for_status()
+            result = response.json()
+            token = result.get("access_token")
+            if not token:
+                raise OCRError(f"获取token失败: {result.get('error_description', result)}")
+            
+            self.token_requests += 1
+            self._token = token
+            # 百度 token 有效期为30天（expires_in 单位为秒）
+            self._expires_at = time.time() + float(result.get("expires_in", 30 * 24 * 3600))
+            self._save_token()
+            return token
+    
+    def recognize(self, image_bytes):
+        """识别图像中的文字，返回每行文字"""
+        image = base64.b64encode(image_bytes).decode()
+        result = self._post(image, self.get_token())
+        if result.get("error_code") in self.TOKEN_ERROR_CODES:
+            result = self._post(image, self.get_token(refresh=True))
+        
+        if "error_code" in result:
+            error_msg = result.get("error_msg", "未知错误")
+            raise OCRError(f"OCR识别错误: {error_msg} (错误码: {result['error_code']})")
+        return [item.get("words", "") for item in result.get("words_result", [])]
+    
+    def _post(self, image, token):
+        response = self.session.post(self.ocr_url, params={"access_token": token}, data={
+            "image": image,
+            "language_type": "CHN_ENG",  # 中英文混合
+            "detect_direction": "true",   # 检测文字方向
+            "recognize_granularity": "small"  # 精细识别模式
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    def close(self):
+        self.session.close()
+
+class OCRClient:
+    """
+    OCR 客户端：上传前缩小并重新压缩图像，按图像内容哈希缓存识别结果
+    """
+    def __init__(self, backend, max_side=1024, jpeg_quality=85, cache_size=256):
+        """
+        :param backend: OCRBackend 实例
+        :param max_side: 上传图像的最长边，超出时等比缩小（单字识别无需原图分辨率）
+        :param jpeg_quality: 重新压缩的 JPEG 质量
+        :param cache_size: 识别结果缓存的条数
+        """
+        self.backend = backend
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self.cache = LRUCache(maxsize=cache_size)
+        self.bytes_sent = 0
+    
+    def prepare_image(self, data):
+        """缩小并压缩为灰度 JPEG；无法解码时原样上传"""
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            return data
+        
+        h, w = img.shape
+        scale = self.max_side / max(h, w)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                             interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok or len(encoded) >= len(data):
+            return data
+        return encoded.tobytes()
+    
+    def recognize(self, image):
+        """
+        识别文字
+        :param image: 图像路径或图像文件字节
+        :return: 按行排列的识别文字列表
+        """
+        if isinstance(image, str):
+            with open(image, "rb") as f:
+                image = f.read()
+        
+        key = (self.backend.name, hashlib.blake2b(image, digest_size=16).hexdigest())
+        lines = self.cache.get(key)
+        if lines is None:
+            payload = self.prepare_image(image)
+            self.bytes_sent += len(payload)
+            lines = self.backend.recognize(payload)
+            self.cache.put(key, lines)
+        return lines
+    
+    def recognize_text(self, image):
+        """识别的全部文字（去除空白）"""
+        return "".join("".join(self.recognize(image)).split())
+    
+    def first_char(self, image):
+        """识别的第一个字符"""
+        text = self.recognize_text(image)
+        if not text:
+            raise OCRError("未识别到文字")
+        return text[0]
+    
+    def close(self):
+        self.backend.close()
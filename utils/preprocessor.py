@@ -1,66 +1,238 @@
+import io
+import math
 import cv2
 import numpy as np
-from PIL import Image, ExifTags
+from PIL import Image, ImageOps
 class ImagePreprocessor:
-    def __init__(self, target_size=(128, 128)):
+    def __init__(self, target_size=(128, 128), kernel_size=3, block_size=11, threshold_c=2,
+                 working_scale=4, roi=False, roi_padding=0.1):
+        """
+        :param kernel_size: 中值滤波核大小
+        :param block_size: 自适应二值化的邻域大小
+        :param threshold_c: 自适应二值化从邻域均值中减去的常数
+        :param working_scale: 工作分辨率（最长边）为目标尺寸的倍数，更大的图像（如手机照片）
+                              缩小到工作分辨率再处理；None 表示按原图分辨率处理
+        :param roi: 墨迹区域优先：先在低分辨率缩略图上定位墨迹范围，只对该区域去噪/二值化，
+                    并保持长宽比归一化（评分不受纸张留白多少的影响；标准库须使用相同设置构建）
+        :param roi_padding: 墨迹区域四周的留白，相对于墨迹范围的长边
+        """
         self.target_size = target_size
+        self.kernel_size = kernel_size
+        self.block_size = block_size
+        self.threshold_c = threshold_c
+        self.working_scale = working_scale
+        self.roi = roi
+        self.roi_padding = roi_padding
     
-    def load_image(self, image_path):
-        """改进的图像加载函数，处理JPG格式问题"""
+    def config(self):
+        """影响预处理结果的参数（用于特征缓存的键）"""
+        return {
+            "target_size": list(self.target_size),
+            "kernel_size": self.kernel_size,
+            "block_size": self.block_size,
+            "threshold_c": self.threshold_c,
+            "working_scale": self.working_scale,
+            "roi": self.roi,
+            "roi_padding": self.roi_padding
+        }
+    
+    def working_side(self):
+        """工作分辨率的最长边，None 表示不限制"""
+        if not self.working_scale:
+            return None
+        return int(self.working_scale * max(self.target_size))
+    
+    def decode_side(self):
+        """读取/解码图像时的最长边上限：墨迹区域优先时须从原分辨率裁剪，不在解码时缩小"""
+        return None if self.roi else self.working_side()
+    
+    def reduce(self, img, max_side=None):
+        """最长边超过 max_side（默认为工作分辨率）时等比缩小，否则原样返回"""
+        max_side = max_side or self.working_side()
+        if not max_side or max(img.shape[:2]) <= max_side:
+            return img
+        return self.resize_long_side(img, max_side)
+    
+    def resize_long_side(self, img, side):
+        """等比缩放到最长边为 side（缩小用 INTER_AREA，放大用 INTER_LINEAR）"""
+        h, w = img.shape[:2]
+        scale = side / max(h, w)
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        return cv2.resize(img, size, interpolation=interpolation)
+    
+    def load_image(self, image_path, max_side=None):
+        """改进的图像加载函数，处理JPG格式问题（max_side 见 decode）"""
+        try:
+            with open(image_path, "rb") as f:
+                data = f.read()
+            return self.decode(data, max_side)
+        except Exception as e:
+            raise ValueError(f"无法加载图像 {image_path}: {str(e)}")
+    
+    def decode(self, data, max_side=None):
+        """
+        从内存中的图像文件字节解码为灰度图（不再访问文件）
+        :param max_side: 结果的最长边上限，None 表示原图分辨率。
+                         JPEG 直接在解码阶段按 1/2、1/4、1/8 缩小并输出灰度，不生成全尺寸彩色图
+        """
         try:
             # 使用PIL读取图像以处理EXIF方向信息
-            pil_img = Image.open(image_path)
+            pil_img = Image.open(io.BytesIO(data))
+            
+            if max_side and max(pil_img.size) > max_side:
+                # 只对 JPEG 生效，解码结果不小于请求的尺寸，其余格式解码后再缩小
+                w, h = pil_img.size
+                scale = max(w, h) / max_side
+                pil_img.draft("L", (math.ceil(w / scale), math.ceil(h / scale)))
             
-            # 检查并应用EXIF方向信息
-            try:
-                for orientation in ExifTags.TAGS.keys():
-                    if ExifTags.TAGS[orientation] == 'Orientation':
-                        break
-                exif = dict(pil_img._getexif().items())
-                if exif[orientation] == 3:
-                    pil_img = pil_img.rotate(180, expand=True)
-                elif exif[orientation] == 6:
-                    pil_img = pil_img.rotate(270, expand=True)
-                elif exif[orientation] == 8:
-                    pil_img = pil_img.rotate(90, expand=True)
-            except (AttributeError, KeyError, IndexError):
-                # 没有EXIF信息
-                pass
+            # 按EXIF方向信息旋转/翻转（支持全部8种方向）
+            pil_img = ImageOps.exif_transpose(pil_img)
             
-            # 转换为OpenCV格式 (BGR)
-            img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+            # 调色板、16位等模式先转为RGB
+            if pil_img.mode not in ("L", "RGB", "RGBA"):
+                pil_img = pil_img.convert("RGB")
+            img = np.array(pil_img)
             
-            # 转换为灰度图
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            # 直接转换为灰度图（与先转BGR再转灰度结果相同，少一次整图复制）
+            if img.ndim == 3:
+                code = cv2.COLOR_RGBA2GRAY if img.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+                img = cv2.cvtColor(img, code)
             
+            if max_side:
+                img = self.reduce(img, max_side)
             return img
         except Exception as e:
-            raise ValueError(f"无法加载图像 {image_path}: {str(e)}")
+            raise ValueError(f"无法解码图像: {str(e)}")
     
     def preprocess(self, image):
         """完整的预处理流程"""
         if isinstance(image, str):
-            img = self.load_image(image)
+            img = self.load_image(image, self.decode_side())
+        elif self.roi:
+            img = image
         else:
-            img = image.copy()
+            img = self.reduce(image)
         
         img = self.to_grayscale(img)
+        if self.roi:
+            return self.preprocess_roi(img)
         img = self.remove_noise(img)
         img = self.binarize(img)
         img = self.normalize_size(img)
         return img
     
+    def preprocess_roi(self, gray):
+        """
+        墨迹区域优先的预处理：裁剪到墨迹范围后再去噪/二值化，保持长宽比归一化
+        gray 应为原分辨率图像：墨迹范围在缩略图上定位后映射回原图裁剪，裁剪结果才缩小到工作分辨率
+        """
+        bbox = self.ink_bbox(gray)
+        if bbox is not None:
+            x, y, w, h = bbox
+            pad = int(round(max(w, h) * self.roi_padding))
+            gray = gray[max(0, y - pad):y + h + pad, max(0, x - pad):x + w + pad]
+        
+        # 裁剪结果只缩小不放大；去噪与二值化的邻域按墨迹区域相对工作分辨率的比例缩放，
+        # 使邻域相对字的大小固定，结果与纸张留白无关
+        gray = self.reduce(gray)
+        scale = max(gray.shape[:2]) / (self.working_side() or 4 * max(self.target_size))
+        img = self.remove_noise(gray, self.scaled_size(self.kernel_size, scale))
+        img = self.binarize(img, self.scaled_size(self.block_size, scale))
+        return self.fit_to_target(img)
+    
+    def scaled_size(self, size, scale):
+        """按比例缩放滤波/邻域窗口大小，结果为不小于3的奇数"""
+        size = int(round(size * scale))
+        return max(3, size | 1)
+    
+    def ink_bbox(self, gray):
+        """
+        在低分辨率缩略图上定位墨迹范围，映射回原图后在该范围附近的原图区域上再定位一次（精确到像素）
+        :return: 原图坐标下的 (x, y, w, h)，没有明显墨迹时返回 None
+        """
+        h, w = gray.shape[:2]
+        proxy_side = 2 * max(self.target_size)
+        scale = min(1.0, proxy_side / max(h, w))
+        proxy = gray
+        if scale < 1:
+            proxy = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))),
+                               interpolation=cv2.INTER_AREA)
+        
+        # 纸面与墨迹对比度过低（空白图）时 Otsu 阈值没有意义
+        if int(proxy.max()) - int(proxy.min()) < 32:
+            return None
+        proxy = cv2.GaussianBlur(proxy, (3, 3), 0)
+        _, mask = cv2.threshold(proxy, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        
+        # 忽略远小于总墨迹量的孤立噪点，保留“丶”等小笔画
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        areas = stats[1:count, cv2.CC_STAT_AREA]
+        if len(areas) == 0:
+            return None
+        boxes = stats[1:count][areas >= 0.01 * areas.sum()]
+        x0 = boxes[:, cv2.CC_STAT_LEFT].min()
+        y0 = boxes[:, cv2.CC_STAT_TOP].min()
+        x1 = (boxes[:, cv2.CC_STAT_LEFT] + boxes[:, cv2.CC_STAT_WIDTH]).max()
+        y1 = (boxes[:, cv2.CC_STAT_TOP] + boxes[:, cv2.CC_STAT_HEIGHT]).max()
+        
+        # 映射回原图坐标（向外取整）
+        x0, y0 = int(x0 / scale), int(y0 / scale)
+        x1, y1 = min(w, int(math.ceil(x1 / scale))), min(h, int(math.ceil(y1 / scale)))
+        if scale < 1:
+            # 缩略图的一个像素对应原图多个像素，外扩两个缩略图像素后在原图区域上细化
+            margin = int(math.ceil(2 / scale))
+            x0, y0 = max(0, x0 - margin), max(0, y0 - margin)
+            x1, y1 = min(w, x1 + margin), min(h, y1 + margin)
+            if (x1 - x0) * (y1 - y0) < h * w:
+                refined = self.ink_bbox(gray[y0:y1, x0:x1])
+                if refined is not None:
+                    rx, ry, rw, rh = refined
+                    return x0 + rx, y0 + ry, rw, rh
+        return x0, y0, x1 - x0, y1 - y0
+    
+    def fit_to_target(self, img):
+        """保持长宽比缩放到目标尺寸内并居中，其余部分为背景（0）"""
+        tw, th = self.target_size
+        h, w = img.shape[:2]
+        scale = min(tw / w, th / h)
+        nw, nh = max(1, round(w * scale)), max(1, round(h * scale))
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        resized = cv2.resize(img, (nw, nh), interpolation=interpolation)
+        
+        canvas = np.zeros((th, tw), dtype=np.uint8)
+        x0, y0 = (tw - nw) // 2, (th - nh) // 2
+        canvas[y0:y0 + nh, x0:x0 + nw] = resized
+        return canvas
+    
+    def preprocess_batch(self, images):
+        """
+        批量预处理，结果写入同一个数组
+        :param images: 图像路径、图像文件字节或图像数组组成的列表
+        :return: N x H x W 的 uint8 数组（W, H 为 target_size）
+        """
+        width, height = self.target_size
+        batch = np.empty((len(images), height, width), dtype=np.uint8)
+        max_side = self.decode_side()
+        for i, image in enumerate(images):
+            if isinstance(image, str):
+                image = self.load_image(image, max_side)
+            elif isinstance(image, (bytes, bytearray, memoryview)):
+                image = self.decode(image, max_side)
+            batch[i] = self.preprocess(image)
+        return batch
+    
     def to_grayscale(self, img):
         """转换为灰度图"""
         if len(img.shape) == 3:
             return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         return img
     
-    def remove_noise(self, img, kernel_size=3):
+    def remove_noise(self, img, kernel_size=None):
         """去噪"""
-        return cv2.medianBlur(img, kernel_size)
+        return cv2.medianBlur(img, kernel_size or self.kernel_size)
     
-    def binarize(self, img):
+    def binarize(self, img, block_size=None):
         """自适应二值化 - 修复方法"""
         # 确保图像是8位单通道
         if img.dtype != np.uint8:
@@ -69,7 +241,7 @@ class ImagePreprocessor:
         # 使用更稳定的二值化方法
         return cv2.adaptiveThreshold(
             img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY_INV, 11, 2
+            cv2.THRESH_BINARY_INV, block_size or self.block_size, self.threshold_c
         )
     
     def normalize_size(self, img):
@@ -0,0 +1,280 @@
+import cv2
+import numpy as np
+
+class PageSegmenter:
+    """
+    整页书写切分为单字
+    支持三种方式：
+    - grid: 检测田字格/方格的长直线，按格子切分
+    - projection: 行/列投影，适用于无格子的横排书写
+    - components: 连通域，适用于排列不规则的书写
+    auto 优先检测格子，检测不到时使用投影
+    """
+    METHODS = ("auto", "grid", "projection", "components")
+    
+    def __init__(self, method="auto", line_ratio=0.6, min_ink=0.005, padding=0.1,
+                 max_aspect=1.2, min_size=12):
+        """
+        :param line_ratio: 格线的最小长度，相对于最长直线
+        :param min_ink: 墨迹占比低于该值的格子视为空格
+        :param padding: 投影/连通域切分时单字四周留白，相对于字的边长
+        :param max_aspect: 投影切分时合并相邻列块的最大宽高比（汉字近似方形）
+        :param min_size: 最小的字/格子边长（像素）
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"不支持的切分方式: {method}，可选: {', '.join(self.METHODS)}")
+        self.method = method
+        self.line_ratio = line_ratio
+        self.min_ink = min_ink
+        self.padding = padding
+        self.max_aspect = max_aspect
+        self.min_size = min_size
+    
+    def segment(self, gray):
+        """
+        切分整页灰度图
+        :return: (实际使用的方式, 单字列表)，按阅读顺序排列，每项包含
+                 row, col, bbox (x, y, w, h), image（灰度裁剪图）, empty
+        """
+        if gray.ndim == 3:
+            gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+        mask = self.ink_mask(gray)
+        
+        if self.method in ("auto", "grid"):
+            cells = self.segment_grid(gray, mask)
+            if cells or self.method == "grid":
+                return "grid", cells
+        if self.method == "components":
+            return "components", self.segment_components(gray, mask)
+        return "projection", self.segment_projection(gray, mask)
+    
+    def ink_mask(self, gray):
+        """整页二值化（墨迹为255），Otsu 阈值对整页光照更稳定"""
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        return mask
+    
+    def paper_level(self, gray):
+        """纸张灰度，用于擦除格线与边界填充"""
+        return int(np.median(gray))
+    
+    def _runs(self, flags):
+        """布尔序列中连续为真的区间 [(start, end), ...]，end 不含"""
+        padded = np.concatenate(([0], flags.astype(np.int8), [0]))
+        changes = np.flatnonzero(np.diff(padded))
+        return list(zip(changes[::2], changes[1::2]))
+    
+    def find_grid_lines(self, mask, dark=None):
+        """
+        检测水平/竖直格线
+        :param dark: 未经模糊的暗像素掩码，提供时排除虚线（田字格中线）
+        :return: (水平线区间, 竖直线区间, 格线掩码)
+        """
+        h, w = mask.shape
+        horizontal = cv2.morphologyEx(
+            mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(w // 10, 10), 1))
+        )
+        vertical = cv2.morphologyEx(
+            mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(h // 10, 10)))
+        )
+        rows = self._line_runs(np.count_nonzero(horizontal, axis=1), w)
+        cols = self._line_runs(np.count_nonzero(vertical, axis=0), h)
+        # 整页掩码经过模糊，较密的虚线中线可能连成长线被当作格线，按原图中沿线的断开次数排除
+        if dark is not None and rows and cols:
+            rows = self._solid_lines(rows, dark, cols[0][0], cols[-1][1])
+            cols = self._solid_lines(cols, dark.T, rows[0][0], rows[-1][1]) if rows else []
+        
+        # 只保留格线所在的行/列，避免把“丨”“一”等长笔画当作格线擦除
+        lines = np.zeros_like(mask)
+        for start, end in rows:
+            lines[start:end] = horizontal[start:end]
+        for start, end in cols:
+            lines[:, start:end] |= vertical[:, start:end]
+        return rows, cols, lines
+    
+    def _line_runs(self, profile, length):
+        """投影中足够长的直线位置（田字格的虚线中线由 segment_grid 排除，并由 erase_midlines 按格子擦除）"""
+        peak = profile.max() if len(profile) else 0
+        if peak < 0.25 * length:
+            return []
+        return self._runs(profile >= self.line_ratio * peak)
+    
+    def segment_grid(self, gray, mask):
+        """按格线切分，返回空列表表示未检测到格子"""
+        paper = self.paper_level(gray)
+        rows, cols, lines = self.find_grid_lines(mask, gray < paper * 0.9)
+        # 相邻格线之间的区域即格子，过窄的间隔（双线）忽略
+        row_spans = [(a[1], b[0]) for a, b in zip(rows, rows[1:]) if b[0] - a[1] >= self.min_size]
+        col_spans = [(a[1], b[0]) for a, b in zip(cols, cols[1:]) if b[0] - a[1] >= self.min_size]
+        if not row_spans or not col_spans or len(row_spans) * len(col_spans) < 2:
+            return []
+        
+        # 擦除格线后再裁剪，避免格线被当作笔画
+        clean = gray.copy()
+        clean[lines > 0] = paper
+        ink = mask.copy()
+        ink[lines > 0] = 0
+        
+        cells = []
+        for r, (y0, y1) in enumerate(row_spans):
+            for c, (x0, x1) in enumerate(col_spans):
+                # 向内收缩，去掉格线的抗锯齿边缘
+                inset = max(1, min(y1 - y0, x1 - x0) // 40)
+                y0i, y1i, x0i, x1i = y0 + inset, y1 - inset, x0 + inset, x1 - inset
+                cell_gray, cell_ink = clean[y0i:y1i, x0i:x1i], ink[y0i:y1i, x0i:x1i]
+                self.erase_midlines(cell_gray, cell_ink, paper)
+                cells.append(self._cell(r, c, (x0i, y0i, x1i - x0i, y1i - y0i), cell_gray, cell_ink))
+        return cells
+    
+    def _solid_lines(self, runs, dark, start, end):
+        """保留实线：在 [start, end) 范围内沿线方向断开的段数很少（虚线每隔几个像素就有纸色的间隙）"""
+        max_segments = max(4, (end - start) // 40)
+        return [(a, b) for a, b in runs
+                if len(self._runs(dark[a:b, start:end].any(axis=0))) <= max_segments]
+    
+    def erase_midlines(self, gray, ink, paper):
+        """
+        擦除格子中的田字格虚线中线（原地修改 gray 与 ink）
+        只在格子中央的横/竖带内查找：比纸张暗的像素沿线方向闭运算连成线，贯穿格子的视为中线；
+        垂直于线方向较厚的墨迹（压在中线上或与之交叉的笔画）保留
+        """
+        dark = (gray < paper * 0.9).astype(np.uint8) * 255
+        self._erase_midline(gray, ink, dark, paper)
+        self._erase_midline(gray.T, ink.T, dark.T, paper)
+    
+    def _erase_midline(self, gray, ink, dark, paper):
+        """擦除水平方向的中线（竖直方向传入转置视图）"""
+        h, w = dark.shape
+        if h < self.min_size or w < self.min_size:
+            return
+        half = max(3, h // 10)
+        top, bottom = h // 2 - half, h // 2 + half
+        band = dark[top:bottom]
+        gap = max(3, w // 10)
+        line = cv2.morphologyEx(band, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (gap, 1)))
+        line = cv2.morphologyEx(line, cv2.MORPH_OPEN,
+                                cv2.getStructuringElement(cv2.MORPH_RECT, (int(0.8 * w), 1)))
+        if not line.any():
+            return
+        
+        # 竖直方向连续超过中线粗细的墨迹属于笔画
+        max_thickness = max(3, h // 30)
+        thick = cv2.morphologyEx(band, cv2.MORPH_OPEN,
+                                 cv2.getStructuringElement(cv2.MORPH_RECT, (1, max_thickness + 1)))
+        # 向两侧各扩一行，包含抗锯齿边缘
+        line = cv2.dilate(line, cv2.getStructuringElement(cv2.MORPH_RECT, (1, 3)))
+        erase = (line > 0) & (thick == 0)
+        gray[top:bottom][erase] = paper
+        ink[top:bottom][erase] = 0
+    
+    def _split_profile(self, profile, merge_gap=0, max_width=None):
+        """
+        按投影切分为有墨迹的区间
+        :param merge_gap: 小于该间隔的相邻区间合并（同一字内部的空隙）
+        :param max_width: 合并后区间的最大宽度
+        """
+        runs = self._runs(profile > 0)
+        merged = []
+        for start, end in runs:
+            if merged:
+                last_start, last_end = merged[-1]
+                close = start - last_end < merge_gap
+                fits = max_width is not None and end - last_start <= max_width
+                if close or fits:
+                    merged[-1] = (last_start, end)
+                    continue
+            merged.append((start, end))
+        return [(s, e) for s, e in merged if e - s >= 2]
+    
+    def segment_projection(self, gray, mask):
+        """按行投影切分文字行，再在每行内按列投影切分单字"""
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))  # 去除孤立噪点
+        bands = self._split_profile(np.count_nonzero(mask, axis=1))
+        if bands:
+            # 行内的上下空隙（如“三”）小于行距，按中位行高合并
+            median_height = np.median([e - s for s, e in bands])
+            bands = self._split_profile(np.count_nonzero(mask, axis=1), merge_gap=0.25 * median_height)
+        
+        paper = self.paper_level(gray)
+        cells = []
+        for r, (y0, y1) in enumerate(bands):
+            band_height = y1 - y0
+            if band_height < self.min_size:
+                continue
+            # 汉字近似方形：合并宽度不超过行高的左右部件（如“川”“明”）
+            spans = self._split_profile(
+                np.count_nonzero(mask[y0:y1], axis=0), max_width=self.max_aspect * band_height
+            )
+            for c, (x0, x1) in enumerate(spans):
+                ys = np.flatnonzero(np.count_nonzero(mask[y0:y1, x0:x1], axis=1))
+                if len(ys) == 0:
+                    continue
+                bbox = (x0, y0 + ys[0], x1 - x0, ys[-1] + 1 - ys[0])
+                cells.append(self._square_cell(r, c, bbox, gray, mask, paper))
+        return cells
+    
+    def segment_components(self, gray, mask):
+        """膨胀后按连通域切分，适合字距不规则的书写"""
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+        join = max(3, min(gray.shape) // 60)
+        joined = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (join, join)))
+        count, _, stats, _ = cv2.connectedComponentsWithStats(joined, connectivity=8)
+        boxes = [
+            (x, y, w, h) for x, y, w, h, _ in stats[1:count]
+            if max(w, h) >= self.min_size
+        ]
+        
+        paper = self.paper_level(gray)
+        cells = []
+        for r, row in enumerate(self._reading_order(boxes)):
+            for c, (x, y, w, h) in enumerate(row):
+                # 去掉膨胀带来的外扩
+                ys, xs = np.nonzero(mask[y:y + h, x:x + w])
+                if len(xs) == 0:
+                    continue
+                bbox = (x + xs.min(), y + ys.min(), xs.max() + 1 - xs.min(), ys.max() + 1 - ys.min())
+                cells.append(self._square_cell(r, c, bbox, gray, mask, paper))
+        return cells
+    
+    def _reading_order(self, boxes):
+        """按从上到下、从左到右分行排列；纵向中心落在当前行范围内的框归为同一行"""
+        rows = []
+        for box in sorted(boxes, key=lambda b: b[1]):
+            center = box[1] + box[3] / 2
+            if rows and center < rows[-1][1]:
+                rows[-1][0].append(box)
+                rows[-1][1] = max(rows[-1][1], box[1] + box[3])
+            else:
+                rows.append([[box], box[1] + box[3]])
+        return [sorted(row, key=lambda b: b[0]) for row, _ in rows]
+    
+    def _square_cell(self, row, col, bbox, gray, mask, paper):
+        """以字的中心裁剪正方形并留白，归一化为正方形时不变形"""
+        x, y, w, h = bbox
+        side = int(round(max(w, h) * (1 + 2 * self.padding)))
+        x0 = int(round(x + w / 2 - side / 2))
+        y0 = int(round(y + h / 2 - side / 2))
+        image = self._crop(gray, x0, y0, side, paper)
+        ink = self._crop(mask, x0, y0, side, 0)
+        return self._cell(row, col, (x0, y0, side, side), image, ink)
+    
+    def _crop(self, img, x0, y0, side, fill):
+        """裁剪正方形区域，超出页面的部分用 fill 填充"""
+        h, w = img.shape[:2]
+        top, left = max(0, -y0), max(0, -x0)
+        bottom, right = max(0, y0 + side - h), max(0, x0 + side - w)
+        crop = img[max(0, y0):min(h, y0 + side), max(0, x0):min(w, x0 + side)]
+        if top or left or bottom or right:
+            crop = cv2.copyMakeBorder(crop, top, bottom, left, right, cv2.BORDER_CONSTANT, value=fill)
+        return crop
+    
+    def _cell(self, row, col, bbox, image, ink):
+        """单字结果，墨迹过少的格子标记为空"""
+        ink_ratio = np.count_nonzero(ink) / ink.size if ink.size else 0.0
+        return {
+            "row": row,
+            "col": col,
+            "bbox": tuple(int(v) for v in bbox),
+            "image": np.ascontiguousarray(image),
+            "empty": bool(ink_ratio < self.min_ink)
+        }